@@ -6,7 +6,9 @@ from enum import Enum
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 
+from src.api_client import close_api_clients
 from src.comments_report import generate_and_send_comments_report
+from src.geo import close_geolocators
 from src.observation_reports import generate_and_send_observation_report
 from src.settings import Settings
 
@@ -33,6 +35,19 @@ def setup_logging():
     logging.getLogger("geopy").setLevel(logging.WARNING)
 
 
+async def run_report(report_type: ReportType, settings: Settings):
+    """Run the selected report, closing pooled API connections on shutdown"""
+    try:
+        match report_type:
+            case ReportType.COMMENTS:
+                await generate_and_send_comments_report(settings)
+            case ReportType.OBSERVATIONS:
+                await generate_and_send_observation_report(settings)
+    finally:
+        await close_api_clients()
+        await close_geolocators()
+
+
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description="Run different types of reports")
@@ -57,12 +72,8 @@ def main():
     # Initialize settings
     settings = Settings()
 
-    # Run the selected report using match statement
-    match config.report_type:
-        case ReportType.COMMENTS:
-            asyncio.run(generate_and_send_comments_report(settings))
-        case ReportType.OBSERVATIONS:
-            asyncio.run(generate_and_send_observation_report(settings))
+    # Run the selected report
+    asyncio.run(run_report(config.report_type, settings))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,31 @@
+import asyncio
+import logging
+
+from inaturalist_client import ApiClient
+from pydantic import validate_call
+
+from src.settings import Settings
+
+log = logging.getLogger(__name__)
+
+# Pooled clients keyed by event loop, host and pool size, since aiohttp
+# sessions are bound to the loop they were created on
+_api_clients: dict[tuple[asyncio.AbstractEventLoop, str, int], ApiClient] = {}
+
+
+@validate_call
+def get_api_client(s: Settings) -> ApiClient:
+    """Get the shared keep-alive iNaturalist API client for the running loop"""
+    key = (asyncio.get_running_loop(), s.inat_host, s.api_pool_size)
+    if key not in _api_clients:
+        log.debug(f"Opening iNaturalist API client pool for {s.inat_host}")
+        _api_clients[key] = ApiClient(s.inat_client_config)
+    return _api_clients[key]
+
+
+async def close_api_clients():
+    """Close all API client pools opened on the running loop"""
+    loop = asyncio.get_running_loop()
+    for key in [key for key in _api_clients if key[0] is loop]:
+        log.debug(f"Closing iNaturalist API client pool for {key[1]}")
+        await _api_clients.pop(key).close()
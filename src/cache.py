@@ -0,0 +1,208 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any, TypeVar
+
+from src.settings import Settings
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Stay under SQLite's limit on bound parameters per statement
+SQLITE_MAX_VARIABLES = 500
+
+
+class SqliteCache:
+    """Disk-backed key/value store with per-entry TTL and LRU eviction.
+
+    Values are pickled. Entries without a TTL never expire but can still be
+    evicted once the store grows past `max_bytes` or `max_entries`, least
+    recently used first.
+    """
+
+    def __init__(
+        self, path: str, max_bytes: int | None = None, max_entries: int | None = None
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB, size INTEGER, "
+                "expires_at REAL, accessed_at REAL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)"
+            )
+
+    def get(self, key: str) -> Any | None:
+        """Return the cached value, or None if missing or expired"""
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                if row is not None:
+                    self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._db.execute(
+                "UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: float | None = None):
+        """Store a value, expiring after `ttl` seconds if given"""
+        now = time.time()
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        expires_at = now + ttl if ttl is not None else None
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), expires_at, now),
+            )
+            self._evict(now)
+
+    def get_many(self, keys: list[str]) -> dict[str, Any]:
+        """Return the unexpired values found for `keys`, in one transaction"""
+        now = time.time()
+        keys = list(dict.fromkeys(keys))
+        rows = []
+        with self._lock, self._db:
+            for i in range(0, len(keys), SQLITE_MAX_VARIABLES):
+                chunk = keys[i : i + SQLITE_MAX_VARIABLES]
+                rows += self._db.execute(
+                    "SELECT key, value FROM entries WHERE key IN "
+                    f"({','.join('?' * len(chunk))}) "
+                    "AND (expires_at IS NULL OR expires_at > ?)",
+                    (*chunk, now),
+                ).fetchall()
+            self._db.executemany(
+                "UPDATE entries SET accessed_at = ? WHERE key = ?",
+                [(now, key) for key, _ in rows],
+            )
+            self.hits += len(rows)
+            self.misses += len(keys) - len(rows)
+        return {key: pickle.loads(value) for key, value in rows}
+
+    def set_many(self, items: dict[str, Any], ttl: float | None = None):
+        """Store several values in one transaction"""
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        blobs = [
+            (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+            for key, value in items.items()
+        ]
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                [(key, blob, len(blob), expires_at, now) for key, blob in blobs],
+            )
+            self._evict(now)
+
+    def delete(self, key: str):
+        """Remove a single entry"""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self):
+        """Remove all entries"""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM entries")
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _evict(self, now: float):
+        self._db.execute(
+            "DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?",
+            (now,),
+        )
+        if self.max_entries is not None:
+            self._db.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries "
+                "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        if self.max_bytes is not None:
+            self._db.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM ("
+                "SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC) AS total "
+                "FROM entries) WHERE total > ?)",
+                (self.max_bytes,),
+            )
+
+
+def make_key(namespace: str, params: dict[str, Any]) -> str:
+    """Build a stable cache key from query parameters.
+
+    None values are dropped and lists are sorted, so equivalent queries
+    share a key regardless of argument order.
+    """
+    normalized = {
+        k: sorted(v, key=str) if isinstance(v, list) else v
+        for k, v in params.items()
+        if v is not None
+    }
+    payload = json.dumps(normalized, sort_keys=True, default=str)
+    return f"{namespace}:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+
+_caches: dict[str, SqliteCache] = {}
+
+
+def open_cache(
+    path: str, max_bytes: int | None = None, max_entries: int | None = None
+) -> SqliteCache:
+    """Get the shared cache stored at `path`, opening it on first use"""
+    if path not in _caches:
+        _caches[path] = SqliteCache(path, max_bytes=max_bytes, max_entries=max_entries)
+    return _caches[path]
+
+
+def get_api_cache(s: Settings) -> SqliteCache | None:
+    """Get the iNaturalist response cache, or None when disabled"""
+    if not s.api_cache_enabled:
+        return None
+    return open_cache(s.api_cache_file, max_bytes=s.api_cache_max_mb * 1024 * 1024)
+
+
+async def cached_request(
+    s: Settings,
+    namespace: str,
+    params: dict[str, Any],
+    ttl: float,
+    request: Callable[[], Awaitable[T]],
+) -> T:
+    """Return a cached API response for `params`, or fetch and store it"""
+    cache = get_api_cache(s)
+    if cache is None:
+        return await request()
+
+    key = make_key(namespace, {**params, "host": s.inat_host})
+    response = cache.get(key)
+    if response is not None:
+        log.debug(f"API cache hit for {namespace}")
+        return response
+
+    response = await request()
+    cache.set(key, response, ttl=ttl)
+    return response
@@ -0,0 +1,113 @@
+import logging
+from bisect import bisect_right
+from collections import deque
+from functools import cache
+
+from src.settings import Settings
+
+log = logging.getLogger(__name__)
+
+# Joins comments for a single scan; not a word character, so matches cannot
+# span two comments
+COMMENT_SEPARATOR = "\n"
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+def _is_boundary(text: str, i: int) -> bool:
+    """Same positions as the regex `\\b`: between a word and a non-word char"""
+    before = i > 0 and _is_word_char(text[i - 1])
+    after = i < len(text) and _is_word_char(text[i])
+    return before != after
+
+
+class TermMatcher:
+    """Aho-Corasick automaton finding whole-word, case-insensitive terms.
+
+    Text is scanned once whatever the number of terms. Matches follow the
+    regex `\\b(term|...)\\b` convention: leftmost first, longest term at a
+    given position, without overlaps.
+    """
+
+    def __init__(self, terms: list[str]):
+        self.terms = list(dict.fromkeys(term.lower() for term in terms if term))
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # Terms ending at each state, including those reached by failure links
+        self._out: list[list[str]] = [[]]
+
+        for term in self.terms:
+            state = 0
+            for char in term:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._out[state].append(term)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def _candidates(self, text: str) -> list[tuple[int, int, str]]:
+        """All (start, end, term) occurrences with word boundaries at both ends"""
+        goto, fail, out = self._goto, self._fail, self._out
+        found = []
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for term in out[state]:
+                start, end = i + 1 - len(term), i + 1
+                if _is_boundary(text, start) and _is_boundary(text, end):
+                    found.append((start, end, term))
+        return found
+
+    def find_all(self, text: str) -> list[tuple[int, str]]:
+        """Leftmost-longest non-overlapping (start, term) matches in `text`"""
+        matches = []
+        last_end = 0
+        for start, end, term in sorted(
+            self._candidates(text.lower()), key=lambda m: (m[0], -m[1])
+        ):
+            if start >= last_end:
+                matches.append((start, term))
+                last_end = end
+        return matches
+
+    def match_comments(self, comments: list[str]) -> list[list[str]]:
+        """Terms found in each comment, scanning all comments in one pass"""
+        # Lowercase first, as it can change lengths and so the offsets
+        comments = [comment.lower() for comment in comments]
+        starts, offset = [], 0
+        for comment in comments:
+            starts.append(offset)
+            offset += len(comment) + len(COMMENT_SEPARATOR)
+
+        terms: list[list[str]] = [[] for _ in comments]
+        for start, term in self.find_all(COMMENT_SEPARATOR.join(comments)):
+            terms[bisect_right(starts, start) - 1].append(term)
+        return terms
+
+
+@cache
+def _build_matcher(terms: tuple[str, ...]) -> TermMatcher:
+    log.debug(f"Building comment flag matcher for {len(terms)} terms")
+    return TermMatcher(list(terms))
+
+
+def get_comment_matcher(s: Settings) -> TermMatcher:
+    """Get the matcher for `s.comment_flags`, built once per flag list"""
+    return _build_matcher(tuple(s.comment_flags))
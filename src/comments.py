@@ -1,91 +1,442 @@
+import asyncio
 import logging
-from datetime import date
+from collections import Counter
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import aclosing
+from datetime import UTC, date, datetime, time, timedelta
+from typing import TypeVar
 
+import pandas as pd
+from inaturalist_client import Observation
 from pydantic import validate_call
 from tqdm import tqdm
-from tqdm.asyncio import tqdm as tqdm_async
 
+from src.cache import SqliteCache, make_key, open_cache
 from src.custom_logging import log_call
-from src.observations import get_all_observations, transform_summaries_to_df
+from src.dates import get_today
+from src.observations import (
+    COMMENT_COUNT_FIELDS,
+    get_observations_by_ids,
+    iter_observations,
+    supports_comment_times,
+    supports_field_projection,
+    transform_summaries_to_df,
+)
 from src.preprocess import (
-    add_location_details,
-    flag_comments,
+    add_location_details_batch_async,
+    flag_comments_df,
     keep_only_first_sample_image,
+    prefilter_summaries_by_country,
 )
 from src.pydantic_models import ObservationSummary
 from src.settings import Settings
 
 log = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+
+def _created_between(comment, since: datetime | None, until: datetime | None) -> bool:
+    """Whether a comment was left in (since, until], naive times being UTC"""
+    created_at = getattr(comment, "created_at", None)
+    if created_at is None:
+        return True
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=UTC)
+    return (since is None or created_at > since) and (
+        until is None or created_at <= until
+    )
+
+
+def _comments_df(
+    s: Settings,
+    observations: list[Observation],
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> pd.DataFrame:
+    """Flat table of the comments of observations, one row per comment.
+
+    With `since`/`until`, only comments created in that interval are kept.
+    """
+    rows = [
+        (o.id, comment.body)
+        for o in observations
+        for comment in o.comments or []
+        if comment.body and _created_between(comment, since, until)
+    ]
+    return pd.DataFrame(rows, columns=[s.observation_id_column, s.comment_column])
+
+
+def _flagged_comments_rows(
+    s: Settings, summaries: list[ObservationSummary], flagged_df: pd.DataFrame
+) -> pd.DataFrame:
+    """One report row per flagged comment, with its observation's details"""
+    summaries_df = transform_summaries_to_df(summaries, s.df_column_map_default)
+    summaries_df = keep_only_first_sample_image(s, summaries_df)
+    summaries_df = summaries_df.drop(
+        columns=[s.flagged_comments_column, s.flagged_terms_column]
+    )
+    df = summaries_df.merge(flagged_df, on=s.observation_id_column)
+    df[s.flagged_terms_column] = df[s.flagged_terms_column].str.join(", ")
+    return df[s.comments_columns]
+
+
+def _concat_rows(s: Settings, dfs: list[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate report rows in order, skipping empty frames"""
+    dfs = [df for df in dfs if not df.empty]
+    if not dfs:
+        return pd.DataFrame(columns=s.comments_columns)
+    return pd.concat(dfs, ignore_index=True)
+
+
+async def _flag_canadian_comments(
+    s: Settings,
+    observations: list[Observation],
+    stage_counts: Counter,
+    comments_since: datetime | None = None,
+    comments_until: datetime | None = None,
+) -> pd.DataFrame:
+    """Flagged comments of the Canadian observations of a page.
+
+    Cheap stages run first so that only observations with flagged comments
+    are converted to summaries, prefiltered by country and geocoded.
+    `stage_counts` gets the number of observations left after each stage.
+    """
+    # Filter to only observations with comments
+    observations = [o for o in observations if o.comments_count > 0]
+    stage_counts["commented"] += len(observations)
+    # Flag all comments of the page in bulk
+    comments_df = _comments_df(s, observations, comments_since, comments_until)
+    flagged_df = flag_comments_df(s, comments_df)
+    flagged_ids = set(flagged_df[s.observation_id_column])
+    summaries = [
+        ObservationSummary.model_validate(o.model_dump())
+        for o in observations
+        if o.id in flagged_ids
+    ]
+    stage_counts["flagged"] += len(summaries)
+    # Drop observations clearly outside Canada, then geocode the rest
+    summaries = prefilter_summaries_by_country(s, summaries, "ca")
+    stage_counts["prefiltered"] += len(summaries)
+    summaries = await add_location_details_batch_async(s, summaries)
+    # Filter to only Canadian observations
+    summaries = [summary for summary in summaries if summary.country == "ca"]
+    stage_counts["canadian"] += len(summaries)
+    return _flagged_comments_rows(s, summaries, flagged_df)
+
+
+async def _flag_pages(
+    s: Settings,
+    pages: AsyncIterator[list[Observation]],
+    two_phase: bool,
+    label: str,
+    comments_since: datetime | None = None,
+    comments_until: datetime | None = None,
+    comment_counts: dict[int, int] | None = None,
+) -> pd.DataFrame:
+    """Run the flagging stages on each page while the next ones download.
+
+    `comment_counts` gets the comment count of each commented observation.
+    """
+    page_dfs = []
+    stage_counts = Counter()
+    with tqdm(desc="Processing observations", unit="obs") as pbar:
+        async with aclosing(pages) as it:
+            async for page in it:
+                stage_counts["fetched"] += len(page)
+                if comment_counts is not None:
+                    comment_counts.update(
+                        (o.id, o.comments_count) for o in page if o.comments_count
+                    )
+                observations = [o for o in page if o.comments_count > 0]
+                if two_phase and observations:
+                    observations = await get_observations_by_ids(
+                        s, [o.id for o in observations]
+                    )
+                page_dfs.append(
+                    await _flag_canadian_comments(
+                        s, observations, stage_counts, comments_since, comments_until
+                    )
+                )
+                pbar.update(len(page))
+    if two_phase:
+        fetch = "two-phase fetch"
+    elif s.comments_two_phase_fetch:
+        fetch = "single-phase fetch, the client has no field projection"
+    else:
+        fetch = "single-phase fetch"
+    log.info(
+        f"{label} ({fetch}): "
+        + " -> ".join(f"{stage} {count}" for stage, count in stage_counts.items())
+    )
+    return _concat_rows(s, page_dfs)
+
+
+async def _flag_date(
+    s: Settings, date_on: date, iconic_taxa: list[str], use_cache: bool = True
+) -> tuple[pd.DataFrame, dict[int, int]]:
+    """Flagged comments of a date, with the comment counts of its observations"""
+    two_phase = s.comments_two_phase_fetch and supports_field_projection(s)
+    pages = iter_observations(
+        s=s,
+        iconic_taxa=iconic_taxa,
+        date_on=date_on,
+        area=s.areas.CA,
+        order="desc",
+        order_by="created_at",
+        fields=COMMENT_COUNT_FIELDS if two_phase else None,
+        use_cache=use_cache,
+    )
+    comment_counts: dict[int, int] = {}
+    df = await _flag_pages(
+        s,
+        pages,
+        two_phase,
+        f"Comments pipeline for {date_on}",
+        comment_counts=comment_counts,
+    )
+    return df, comment_counts
+
 
 @log_call
 @validate_call
-async def get_canadian_observations_with_flagged_comments(
+async def get_canadian_observations_with_flagged_comments_df(
     s: Settings, date_on: date, iconic_taxa: list[str]
 ):
-    """Get Canadian observations with flagged comments for given date and taxa."""
-    # Get all observations for the given date and taxa
-    observations = await get_all_observations(
+    """Get DataFrame of flagged comments of Canadian observations for a date.
+
+    In two-phase mode the scan only asks for ids and comment counts, and
+    full details are fetched by id for the commented observations alone.
+    """
+    df, _ = await _flag_date(s, date_on, iconic_taxa)
+    return df
+
+
+# Bump when the pipeline changes the rows it produces for a date
+COMMENTS_DAY_CACHE_VERSION = 3
+
+
+def get_comments_day_cache(s: Settings) -> SqliteCache | None:
+    """Get the per-date flagged comments cache, or None when disabled"""
+    if not s.comments_day_cache_enabled:
+        return None
+    return open_cache(
+        s.comments_day_cache_file, max_entries=s.comments_day_cache_max_entries
+    )
+
+
+def _comments_day_key(s: Settings, date_on: date, iconic_taxa: list[str]) -> str:
+    """Cache key covering every input that shapes the rows of a date"""
+    return make_key(
+        "comments_day",
+        {
+            "version": COMMENTS_DAY_CACHE_VERSION,
+            "date": date_on,
+            "iconic_taxa": iconic_taxa,
+            "comment_flags": s.comment_flags,
+            "host": s.inat_host,
+            "area": s.areas.CA.model_dump(),
+            "geocoder": s.geocoder,
+            "country_prefilter": s.country_prefilter,
+            "columns": ",".join(s.comments_columns),
+        },
+    )
+
+
+async def _comments_changed(
+    s: Settings, date_on: date, iconic_taxa: list[str], entry: dict
+) -> bool:
+    """Whether an observation of a date gained or lost comments since its entry"""
+    pages = iter_observations(
         s=s,
         iconic_taxa=iconic_taxa,
         date_on=date_on,
         area=s.areas.CA,
-        order="desc",
-        order_by="created_at",
+        updated_since=entry["computed_at"],
+        fields=COMMENT_COUNT_FIELDS if supports_field_projection(s) else None,
+        use_cache=False,
     )
-    # Filter to only observations with comments
-    observations = [
-        o
-        for o in tqdm(observations, desc="Filtering observations with comments")
-        if o.comments_count > 0
-    ]
-    # Convert to summaries and add location details
-    summaries = [
-        add_location_details(s, ObservationSummary.model_validate(o.model_dump()))
-        for o in tqdm(observations, desc="Generating observation summary locations")
-    ]
-    # Filter to only Canadian observations
-    summaries = [
-        summary
-        for summary in tqdm(summaries, desc="Filtering for Canada")
-        if summary.country == "ca"
-    ]
-    # Flag comments containing terms of interest
-    summaries = [
-        flag_comments(s, summary)
-        for summary in tqdm(summaries, desc="Flagging comments")
-    ]
-    # Keep only summaries with flagged comments
-    summaries = [s for s in summaries if s.flagged_comments]
-    return summaries
+    counts = entry["comment_counts"]
+    async with aclosing(pages) as it:
+        async for page in it:
+            if any(o.comments_count != counts.get(o.id, 0) for o in page):
+                return True
+    return False
+
+
+async def _get_date_df(
+    s: Settings, date_on: date, iconic_taxa: list[str]
+) -> pd.DataFrame:
+    """Rows of a date from the day cache, or computed and stored.
+
+    Cached rows are only used while the comment counts of the date's
+    observations are unchanged. Today is never cached as its observations
+    are still coming in.
+    """
+    cache = get_comments_day_cache(s)
+    if cache is None or date_on >= get_today():
+        return await _with_retries(
+            s,
+            date_on,
+            lambda: get_canadian_observations_with_flagged_comments_df(
+                s, date_on, iconic_taxa
+            ),
+        )
+
+    key = _comments_day_key(s, date_on, iconic_taxa)
+    entry = cache.get(key)
+    checked_at = datetime.now(UTC)
+    if entry is not None and not await _with_retries(
+        s, date_on, lambda: _comments_changed(s, date_on, iconic_taxa, entry)
+    ):
+        log.info(f"Comments for {date_on} served from the day cache")
+        # Updates up to the check are accounted for, the next check starts there
+        cache.set(
+            key, {**entry, "computed_at": checked_at}, ttl=s.comments_day_cache_ttl
+        )
+        return entry["df"]
+
+    # Fetched past the API cache, so the rows are as recent as checked_at
+    df, comment_counts = await _with_retries(
+        s, date_on, lambda: _flag_date(s, date_on, iconic_taxa, use_cache=False)
+    )
+    cache.set(
+        key,
+        {"df": df, "computed_at": checked_at, "comment_counts": comment_counts},
+        ttl=s.comments_day_cache_ttl,
+    )
+    return df
+
+
+async def _with_retries(
+    s: Settings, date_on: date, request: Callable[[], Awaitable[T]]
+) -> T:
+    """Run a step of one date, retrying it with exponential backoff"""
+    for attempt in range(s.comments_date_max_retries + 1):
+        try:
+            return await request()
+        except Exception as e:
+            if attempt == s.comments_date_max_retries:
+                raise
+            delay = s.api_retry_backoff * 2**attempt
+            log.warning(
+                f"Comments pipeline for {date_on} failed ({e}), retrying in "
+                f"{delay:.1f}s (attempt {attempt + 1}/{s.comments_date_max_retries})"
+            )
+            await asyncio.sleep(delay)
 
 
 @log_call
 @validate_call
 async def get_all_canadian_observations_with_flagged_comments_df(
     s: Settings, dates: list[date], iconic_taxa: list[str]
-):
-    """Get DataFrame of Canadian observations with flagged comments for date range."""
+) -> tuple[pd.DataFrame, list[date]]:
+    """Get DataFrame of Canadian observations with flagged comments for date range.
+
+    Past dates already in the day cache are not fetched again unless some
+    of their observations were updated since. Up to comments_max_concurrent_dates
+    dates run at once, sharing the API rate limit and request slots, and rows
+    are merged in date order. A date that still fails after its retries is
+    left out and returned with the dates that failed; if every date fails
+    the last error is raised.
+    """
     if not dates:
         raise ValueError("No dates provided.")
-    # Get summaries for all dates
-    all_summaries = []
-    for d in tqdm_async(dates, desc="Processing dates"):
-        summaries = await get_canadian_observations_with_flagged_comments(
-            s, d, iconic_taxa
+    semaphore = asyncio.Semaphore(s.comments_max_concurrent_dates)
+    date_dfs: list[pd.DataFrame | None] = [None] * len(dates)
+    errors = []
+
+    async def process(i: int, date_on: date):
+        async with semaphore:
+            try:
+                date_dfs[i] = await _get_date_df(s, date_on, iconic_taxa)
+            except Exception as e:
+                log.exception(f"Skipping comments for {date_on}")
+                errors.append(e)
+            pbar.update(1)
+
+    with tqdm(total=len(dates), desc="Processing dates") as pbar:
+        async with asyncio.TaskGroup() as tg:
+            for i, date_on in enumerate(dates):
+                tg.create_task(process(i, date_on))
+
+    if len(errors) == len(dates):
+        raise errors[-1]
+    failed_dates = [date_on for date_on, df in zip(dates, date_dfs) if df is None]
+    return _concat_rows(s, [df for df in date_dfs if df is not None]), failed_dates
+
+
+def _late_comments_key(s: Settings, iconic_taxa: list[str]) -> str:
+    """Key of the late comments watermark in the incremental state store"""
+    return make_key(
+        "comments_watermark",
+        {
+            "iconic_taxa": iconic_taxa,
+            "comment_flags": s.comment_flags,
+            "host": s.inat_host,
+            "area": s.areas.CA.model_dump(),
+        },
+    )
+
+
+@log_call
+@validate_call
+async def get_late_canadian_flagged_comments_df(
+    s: Settings, before: date, iconic_taxa: list[str]
+) -> tuple[pd.DataFrame, datetime]:
+    """Get flagged comments left since the last run on older observations.
+
+    Observations created before `before`, the dates from there on being
+    covered by the daily pipeline, are found by update time from a persisted
+    watermark, and only comments created since the watermark are flagged.
+    The first run starts from `before`. Returns the rows and the next
+    watermark, to be saved with save_late_comments_watermark once the rows
+    were delivered.
+    """
+    if not supports_comment_times():
+        raise ValueError(
+            "The iNaturalist client has no comment creation times, late comments "
+            "cannot be told apart from the ones already flagged."
         )
-        all_summaries.extend(summaries)
-    # Convert summaries to DataFrame and process
-    summaries_df = transform_summaries_to_df(all_summaries, s.df_column_map_default)
-    summaries_df = keep_only_first_sample_image(s, summaries_df)
-    # Explode flagged comments and terms into separate rows
-    summaries_df = summaries_df.explode(
-        [s.flagged_comments_column, s.flagged_terms_column], ignore_index=True
+    store = open_cache(
+        s.incremental_state_file, max_entries=s.incremental_state_max_entries
+    )
+    started_at = datetime.now(UTC)
+    since = store.get(_late_comments_key(s, iconic_taxa)) or datetime.combine(
+        before, time.min, UTC
+    )
+
+    two_phase = s.comments_two_phase_fetch and supports_field_projection(s)
+    pages = iter_observations(
+        s=s,
+        iconic_taxa=iconic_taxa,
+        date_to=datetime.combine(before - timedelta(days=1), time.max),
+        area=s.areas.CA,
+        updated_since=since,
+        order="desc",
+        order_by="updated_at",
+        fields=COMMENT_COUNT_FIELDS if two_phase else None,
+    )
+    df = await _flag_pages(
+        s,
+        pages,
+        two_phase,
+        f"Late comments since {since:%Y-%m-%d %H:%M}",
+        comments_since=since,
+        comments_until=started_at,
+    )
+    return df, started_at
+
+
+@validate_call
+def save_late_comments_watermark(
+    s: Settings, iconic_taxa: list[str], watermark: datetime
+):
+    """Move the late comments watermark on after a report was sent"""
+    store = open_cache(
+        s.incremental_state_file, max_entries=s.incremental_state_max_entries
     )
-    # Filter and select columns
-    summaries_df = summaries_df[summaries_df[s.flagged_comments_column].notna()]
-    summaries_df = summaries_df[s.comments_columns]
-    return summaries_df
+    store.set(_late_comments_key(s, iconic_taxa), watermark)
 
 
 if __name__ == "__main__":
@@ -111,9 +462,11 @@ if __name__ == "__main__":
         dates = get_recent_dates(7)
 
         # Get flagged comments DataFrame
-        df = await get_all_canadian_observations_with_flagged_comments_df(
+        df, failed_dates = await get_all_canadian_observations_with_flagged_comments_df(
             s, dates, iconic_taxa
         )
+        if failed_dates:
+            print(f"Could not process {failed_dates}")
 
         print(f"Flagged observations in Canada from {dates[0]} to {dates[-1]}.\n", df)
 
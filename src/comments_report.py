@@ -6,7 +6,11 @@ from datetime import date
 import pandas as pd
 from pydantic import validate_call
 
-from src.comments import get_all_canadian_observations_with_flagged_comments_df
+from src.comments import (
+    get_all_canadian_observations_with_flagged_comments_df,
+    get_late_canadian_flagged_comments_df,
+    save_late_comments_watermark,
+)
 from src.custom_logging import log_call
 from src.dates import get_recent_dates
 from src.emails import render_email_body, send_smtp_emails
@@ -53,6 +57,21 @@ def build_comments_email_tables(df: pd.DataFrame):
     ]
 
 
+@log_call
+@validate_call
+def build_failed_dates_tables(failed_dates: list[date]):
+    """Create an HTML table of the dates missing from the report"""
+    if not failed_dates:
+        return []
+    df = pd.DataFrame({"Date": failed_dates})
+    return [
+        EmailTable(
+            title="Dates Not Processed",
+            html=df.to_html(index=False, justify="center"),
+        )
+    ]
+
+
 @log_call
 @validate_call(config=dict(arbitrary_types_allowed=True))
 def send_flagged_comments_email(
@@ -60,16 +79,19 @@ def send_flagged_comments_email(
     df_flagged_comments: pd.DataFrame,
     date_from: date,
     date_to: date,
+    error: bool = False,
+    failed_dates: list[date] | None = None,
 ):
     """Send email with flagged comments to recipients"""
     log.info(f"Preparing flagged comments email for period {date_from} to {date_to}")
     # Generate email subject using template
-    error = df_flagged_comments.empty
+    error = error or df_flagged_comments.empty
     subject = s.comments_email_subject_template.render(
         date_from=date_from, date_to=date_to, error=error
     )
     # Build HTML tables and email body
     tables = build_comments_email_tables(df_flagged_comments)
+    tables += build_failed_dates_tables(failed_dates or [])
     body = render_email_body(
         s.comments_email_body_template,
         tables,
@@ -88,6 +110,8 @@ async def generate_and_send_comments_report(s: Settings):
     dates = get_recent_dates(s.number_days_back)
     log.info(f"Processing comments for period: {dates[0]} to {dates[-1]}")
 
+    fetch_failed = False
+    failed_dates = []
     try:
         # Try loading cached data
         comments_df = load_cached_data(s)
@@ -95,7 +119,10 @@ async def generate_and_send_comments_report(s: Settings):
         # If no cache or empty DataFrame, fetch new data
         if comments_df is None or comments_df.empty:
             log.info("Fetching new comments data")
-            comments_df = await get_all_canadian_observations_with_flagged_comments_df(
+            (
+                comments_df,
+                failed_dates,
+            ) = await get_all_canadian_observations_with_flagged_comments_df(
                 s, dates, [s.iconic_taxa]
             )
             log.info(f"Retrieved {len(comments_df)} flagged comments")
@@ -104,10 +131,33 @@ async def generate_and_send_comments_report(s: Settings):
         # Log any errors and create empty dataframe
         log.error(f"Error generating comments report: {e}", exc_info=True)
         comments_df = pd.DataFrame()
+        fetch_failed = True
+
+    late_watermark = None
+    if s.comments_late_scan:
+        # Add new comments on observations created before the period
+        try:
+            late_df, late_watermark = await get_late_canadian_flagged_comments_df(
+                s, dates[0], [s.iconic_taxa]
+            )
+            log.info(f"Retrieved {len(late_df)} late flagged comments")
+            comments_df = pd.concat([comments_df, late_df], ignore_index=True)
+        except Exception:
+            log.exception("Error fetching late comments")
 
     # Send email with results
     log.info("Sending comments report email")
-    send_flagged_comments_email(s, comments_df, dates[0], dates[-1])
+    send_flagged_comments_email(
+        s,
+        comments_df,
+        dates[0],
+        dates[-1],
+        error=fetch_failed,
+        failed_dates=failed_dates,
+    )
+    # Only once the late comments were sent, so a failed email does not lose them
+    if late_watermark is not None:
+        save_late_comments_watermark(s, [s.iconic_taxa], late_watermark)
 
 
 if __name__ == "__main__":
@@ -3,8 +3,12 @@ from datetime import datetime, timedelta
 from pydantic import validate_call
 
 
+def get_today():
+    return datetime.now().date()
+
+
 def get_yesterday():
-    return (datetime.now() - timedelta(days=1)).date()
+    return get_today() - timedelta(days=1)
 
 
 @validate_call
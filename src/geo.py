@@ -1,36 +1,381 @@
+import asyncio
+import json
 import logging
+import threading
+from functools import cache
 
+import numpy as np
+import reverse_geocode
+from geopy.adapters import AioHTTPAdapter
+from geopy.exc import GeopyError
 from geopy.geocoders import Nominatim
 from pydantic import validate_call
 
+from src.cache import SqliteCache, open_cache
 from src.custom_logging import log_call
-from src.settings import Settings
+from src.rate_limit import TokenBucket
+from src.settings import GeocoderBackend, Settings
 
 log = logging.getLogger(__name__)
 
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.2
+
+
+def _address_to_location(location) -> tuple[str, str, str]:
+    """(city, province, country) from a Nominatim reverse geocoding answer"""
+    address = location.raw["address"] if location and location.raw else {}
+    city = (
+        address.get("city", "")
+        or address.get("town", "")
+        or address.get("village", "")
+        or address.get("municipality", "")
+        or address.get("county", "")
+        or address.get("state_district", "")
+    )
+    province, country = address.get("state", ""), address.get("country_code", "")
+    return city, province, country
+
+
+@cache
+def _get_locator(user_agent: str, domain: str, scheme: str, timeout: float):
+    """Blocking Nominatim client, built once per endpoint"""
+    return Nominatim(
+        user_agent=user_agent, domain=domain, scheme=scheme, timeout=timeout
+    )
+
 
 @log_call
 @validate_call
 def get_city_province_country(s: Settings, lat: float, lon: float):
-    locator = Nominatim(user_agent=s.nominatim_user_agent, timeout=10)
+    """Blocking Nominatim lookup through the shared limits"""
+    locator = _get_locator(
+        s.nominatim_user_agent,
+        s.nominatim_domain,
+        s.nominatim_scheme,
+        s.nominatim_timeout,
+    )
     try:
-        location = locator.reverse((lat, lon), language="en")
-        address = location.raw["address"] if location and location.raw else {}
-        city = (
-            address.get("city", "")
-            or address.get("town", "")
-            or address.get("village", "")
-            or address.get("municipality", "")
-            or address.get("county", "")
-            or address.get("state_district", "")
+        with get_nominatim_thread_slots(s):
+            get_nominatim_rate_limiter(s).acquire_blocking()
+            location = locator.reverse((lat, lon), language="en")
+        return _address_to_location(location)
+    except GeopyError as e:
+        log.debug(f"Reverse geocoding failed for ({lat}, {lon}): {e}")
+        return "", "", ""
+
+
+# Async geolocators keyed by event loop and endpoint, like the API clients
+# of src.api_client
+_geolocators: dict[tuple[asyncio.AbstractEventLoop, str], Nominatim] = {}
+_nominatim_buckets: dict[tuple[str, float, int], TokenBucket] = {}
+# In-flight lookup slots per endpoint: one thread semaphore for the blocking
+# client, and one asyncio semaphore per loop for the async client
+_nominatim_thread_slots: dict[tuple[str, int], threading.BoundedSemaphore] = {}
+_nominatim_slots: dict[
+    tuple[asyncio.AbstractEventLoop, str, int], asyncio.Semaphore
+] = {}
+
+
+def get_async_geolocator(s: Settings) -> Nominatim:
+    """Get the shared keep-alive Nominatim client for the running loop"""
+    endpoint = f"{s.nominatim_scheme}://{s.nominatim_domain}"
+    key = (asyncio.get_running_loop(), endpoint)
+    if key not in _geolocators:
+        log.debug(f"Opening Nominatim client pool for {endpoint}")
+        _geolocators[key] = Nominatim(
+            user_agent=s.nominatim_user_agent,
+            domain=s.nominatim_domain,
+            scheme=s.nominatim_scheme,
+            timeout=s.nominatim_timeout,
+            adapter_factory=AioHTTPAdapter,
+        )
+    return _geolocators[key]
+
+
+async def close_geolocators():
+    """Close all Nominatim client pools opened on the running loop"""
+    loop = asyncio.get_running_loop()
+    for key in [key for key in _geolocators if key[0] is loop]:
+        log.debug(f"Closing Nominatim client pool for {key[1]}")
+        await _geolocators.pop(key).__aexit__(None, None, None)
+
+
+def get_nominatim_rate_limiter(s: Settings) -> TokenBucket:
+    """Get the token bucket shared by all requests to the Nominatim endpoint"""
+    key = (
+        s.nominatim_domain,
+        s.nominatim_requests_per_second,
+        s.nominatim_max_concurrency,
+    )
+    if key not in _nominatim_buckets:
+        # setdefault, as worker threads may race to create the bucket
+        _nominatim_buckets.setdefault(
+            key,
+            TokenBucket(s.nominatim_requests_per_second, s.nominatim_max_concurrency),
+        )
+    return _nominatim_buckets[key]
+
+
+def get_nominatim_thread_slots(s: Settings) -> threading.BoundedSemaphore:
+    """Get the semaphore capping blocking lookups in flight across threads"""
+    key = (s.nominatim_domain, s.nominatim_max_concurrency)
+    if key not in _nominatim_thread_slots:
+        _nominatim_thread_slots.setdefault(
+            key, threading.BoundedSemaphore(s.nominatim_max_concurrency)
         )
-        province, country = address.get("state", ""), address.get("country_code", "")
-        return city, province, country
-    except Exception as e:
+    return _nominatim_thread_slots[key]
+
+
+def get_nominatim_slots(s: Settings) -> asyncio.Semaphore:
+    """Get the semaphore capping async lookups in flight on the running loop"""
+    key = (asyncio.get_running_loop(), s.nominatim_domain, s.nominatim_max_concurrency)
+    if key not in _nominatim_slots:
+        _nominatim_slots[key] = asyncio.Semaphore(s.nominatim_max_concurrency)
+    return _nominatim_slots[key]
+
+
+async def get_city_province_country_async(s: Settings, lat: float, lon: float):
+    """Non-blocking Nominatim lookup through the shared client and limits"""
+    try:
+        async with get_nominatim_slots(s):
+            await get_nominatim_rate_limiter(s).acquire()
+            location = await get_async_geolocator(s).reverse((lat, lon), language="en")
+        return _address_to_location(location)
+    except GeopyError as e:
         log.debug(f"Reverse geocoding failed for ({lat}, {lon}): {e}")
         return "", "", ""
 
 
+def get_geocode_cache(s: Settings) -> SqliteCache | None:
+    """Get the on-disk geocode cache, or None when disabled"""
+    if not s.geocode_cache_enabled:
+        return None
+    return open_cache(s.geocode_cache_file, max_entries=s.geocode_cache_max_entries)
+
+
+def _geocode_cache_lookup(s: Settings, coordinates: list[tuple[float, float]]):
+    """Cache keys of the points, cached answers and the points left to look up"""
+    precision = s.geocode_cache_precision
+    keys = [
+        f"nominatim:{lat:.{precision}f},{lon:.{precision}f}" for lat, lon in coordinates
+    ]
+    cache = get_geocode_cache(s)
+    cached = cache.get_many(keys) if cache is not None else {}
+    missing = {key: point for key, point in zip(keys, coordinates) if key not in cached}
+    return keys, cached, missing
+
+
+def _geocode_cache_store(
+    s: Settings,
+    keys: list[str],
+    cached: dict[str, tuple[str, str, str]],
+    looked_up: dict[str, tuple[str, str, str]],
+) -> list[tuple[str, str, str]]:
+    """Store new answers and return the location of every point"""
+    cache = get_geocode_cache(s)
+    if cache is not None:
+        log.debug(
+            f"Geocode cache: {len(cached)} hits, {len(looked_up)} Nominatim lookups "
+            f"({cache.hits} hits / {cache.misses} misses this run)"
+        )
+        # Failed lookups come back empty, leave them to be retried next time
+        cache.set_many({key: loc for key, loc in looked_up.items() if any(loc)})
+    return [cached[key] if key in cached else looked_up[key] for key in keys]
+
+
+def _reverse_geocode_nominatim(
+    s: Settings, coordinates: list[tuple[float, float]]
+) -> list[tuple[str, str, str]]:
+    """Nominatim lookups for each point, served from the geocode cache if possible"""
+    keys, cached, missing = _geocode_cache_lookup(s, coordinates)
+    looked_up = {
+        key: get_city_province_country(s, lat, lon)
+        for key, (lat, lon) in missing.items()
+    }
+    return _geocode_cache_store(s, keys, cached, looked_up)
+
+
+async def _reverse_geocode_nominatim_async(
+    s: Settings, coordinates: list[tuple[float, float]]
+) -> list[tuple[str, str, str]]:
+    """Concurrent Nominatim lookups for the points missing from the cache"""
+    keys, cached, missing = _geocode_cache_lookup(s, coordinates)
+    found = await asyncio.gather(
+        *(get_city_province_country_async(s, lat, lon) for lat, lon in missing.values())
+    )
+    return _geocode_cache_store(s, keys, cached, dict(zip(missing, found)))
+
+
+def haversine_km(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Great-circle distances between two arrays of (lat, lon) in degrees"""
+    lat1, lon1, lat2, lon2 = np.radians([a[:, 0], a[:, 1], b[:, 0], b[:, 1]])
+    h = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(h))
+
+
+def _reverse_geocode_offline(points: np.ndarray):
+    """Nearest gazetteer place for each point, with its distance in km"""
+    places = reverse_geocode.search(points)
+    locations = [
+        (
+            place.get("city", ""),
+            place.get("state", ""),
+            place.get("country_code", "").lower(),
+        )
+        for place in places
+    ]
+    nearest = np.array([(place["latitude"], place["longitude"]) for place in places])
+    return locations, haversine_km(points, nearest)
+
+
+def _reverse_geocode_offline_points(
+    s: Settings, coordinates: list[tuple[float, float]]
+) -> tuple[list[tuple[str, str, str]], list[int]]:
+    """Offline locations, with the indices of points to send to Nominatim"""
+    locations = [("", "", "")] * len(coordinates)
+    if s.geocoder == GeocoderBackend.NOMINATIM:
+        return locations, list(range(len(coordinates)))
+
+    points = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+    valid = np.flatnonzero(np.isfinite(points).all(axis=1))
+    if valid.size == 0:
+        return locations, []
+
+    found, distances = _reverse_geocode_offline(points[valid])
+    # The nearest place can be across a border, so the boundary polygons
+    # decide the country wherever they are certain. The place's city and
+    # province then belong to the other country and are dropped.
+    countries = get_countries(s, points[valid].tolist())
+    crossed = []
+    for i, location, country in zip(valid, found, countries):
+        if country and country != location[2]:
+            location = ("", "", country)
+            crossed.append(i)
+        locations[i] = location
+
+    if not s.geocoder_nominatim_fallback:
+        return locations, []
+    far = valid[distances > s.geocoder_fallback_distance_km].tolist()
+    log.debug(
+        f"Falling back to Nominatim for {len(far)} remote and "
+        f"{len(crossed)} cross-border points"
+    )
+    return locations, sorted(set(far) | set(crossed))
+
+
+def _merge_locations(
+    locations: list[tuple[str, str, str]],
+    far: list[int],
+    fallback: list[tuple[str, str, str]],
+) -> list[tuple[str, str, str]]:
+    """Apply the Nominatim fallback answers to the offline locations"""
+    for i, location in zip(far, fallback):
+        if any(location):
+            locations[i] = location
+    return locations
+
+
+@validate_call
+def get_locations(
+    s: Settings, coordinates: list[tuple[float, float]]
+) -> list[tuple[str, str, str]]:
+    """Reverse geocode (lat, lon) pairs to (city, province, country) tuples.
+
+    The offline backend answers every point with a single nearest-neighbour
+    query on the GeoNames gazetteer shipped with reverse_geocode. Points
+    further than geocoder_fallback_distance_km from any place can be sent
+    to Nominatim instead when geocoder_nominatim_fallback is set. Nominatim
+    answers are kept in the geocode cache.
+    """
+    locations, far = _reverse_geocode_offline_points(s, coordinates)
+    fallback = _reverse_geocode_nominatim(s, [coordinates[i] for i in far])
+    return _merge_locations(locations, far, fallback)
+
+
+@validate_call
+async def get_locations_async(
+    s: Settings, coordinates: list[tuple[float, float]]
+) -> list[tuple[str, str, str]]:
+    """Like get_locations, with concurrent non-blocking Nominatim lookups"""
+    locations, far = _reverse_geocode_offline_points(s, coordinates)
+    fallback = await _reverse_geocode_nominatim_async(s, [coordinates[i] for i in far])
+    return _merge_locations(locations, far, fallback)
+
+
+@cache
+def load_country_boundaries(path: str) -> dict[str, list[np.ndarray]]:
+    """Load bundled GeoJSON boundaries as (lat, lon) rings per country code"""
+    with open(path, encoding="utf-8") as f:
+        features = json.load(f)["features"]
+    boundaries: dict[str, list[np.ndarray]] = {}
+    for feature in features:
+        geometry = feature["geometry"]
+        polygons = geometry["coordinates"]
+        if geometry["type"] == "Polygon":
+            polygons = [polygons]
+        # Only outer rings are used, the simplified shapes have no holes
+        boundaries.setdefault(feature["properties"]["country_code"], []).extend(
+            np.array(polygon[0], dtype=float)[:-1, ::-1] for polygon in polygons
+        )
+    return boundaries
+
+
+def points_in_ring(points: np.ndarray, ring: np.ndarray) -> np.ndarray:
+    """Even-odd ray casting test of (lat, lon) points against a closed ring"""
+    y, x = points[:, :1], points[:, 1:]
+    y1, x1 = ring[:, 0], ring[:, 1]
+    y2, x2 = np.roll(y1, -1), np.roll(x1, -1)
+    crosses = (y1 > y) != (y2 > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    return (crosses & (x < x_cross)).sum(axis=1) % 2 == 1
+
+
+def distance_to_ring_km(points: np.ndarray, ring: np.ndarray) -> np.ndarray:
+    """Approximate distance from (lat, lon) points to the edges of a ring"""
+    # Equirectangular projection around each point, fine at border scale
+    scale = np.cos(np.radians(points[:, :1]))
+    py, px = points[:, :1], points[:, 1:] * scale
+    ay, ax = ring[:, 0], ring[:, 1] * scale
+    dy, dx = np.roll(ay, -1) - ay, np.roll(ax, -1, axis=-1) - ax
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.clip(((px - ax) * dx + (py - ay) * dy) / (dx**2 + dy**2), 0, 1)
+    distances = np.hypot(px - ax - t * dx, py - ay - t * dy)
+    return distances.min(axis=1) * KM_PER_DEGREE
+
+
+@validate_call
+def get_countries(s: Settings, coordinates: list[tuple[float, float]]) -> np.ndarray:
+    """Country code of (lat, lon) points from the bundled boundary polygons.
+
+    Returns "" for points outside every polygon and None for points closer
+    than country_border_buffer_km to a polygon edge, which are left for
+    the geocoder to decide.
+    """
+    countries = np.full(len(coordinates), None, dtype=object)
+    points = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+    valid = np.isfinite(points).all(axis=1)
+    if not valid.any():
+        return countries
+
+    points = points[valid]
+    decided = np.full(len(points), "", dtype=object)
+    near_border = np.zeros(len(points), dtype=bool)
+    for country, rings in load_country_boundaries(s.country_boundaries_file).items():
+        for ring in rings:
+            decided[points_in_ring(points, ring)] = country
+            near_border |= (
+                distance_to_ring_km(points, ring) < s.country_border_buffer_km
+            )
+    decided[near_border] = None
+    countries[valid] = decided
+    return countries
+
+
 if __name__ == "__main__":
     # Test coordinates (latitude, longitude)
     # Run: python -m src.geo
@@ -47,8 +392,9 @@ if __name__ == "__main__":
         (48.8566, 2.3522),
     ]
 
-    for coord in test_coords:
-        city, province, country = get_city_province_country(s, coord[0], coord[1])
+    for coord, (city, province, country) in zip(
+        test_coords, get_locations(s, test_coords)
+    ):
         print(
             f"Coordinates: {coord} -> City: {city}, Province: {province}, Country: {country}"
         )
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from datetime import date
 
@@ -71,61 +72,44 @@ def send_observation_report_email(
     log.info("All observations emails sent successfully.")
 
 
-@log_call
-@validate_call
-async def generate_and_send_observation_report(s: Settings):
-    """Generate and send observation report email with ML predictions."""
-    log.info("Starting observation report generation")
-    # Get list of regulated species IDs and yesterday's date
-    regulated_taxon_ids = await get_specie_ids(s)
-    observations_date = get_yesterday()
-    log.info(f"Processing observations for date: {observations_date}")
-
-    # Load pre-trained DenseNet model
-    log.info("Loading DenseNet model")
-    model = load_densenet_model(s.species_classification_model_path)
-
-    # Process Canadian observations
-    log.info("Fetching Canadian observations")
-    ca_summaries_df = await get_observation_summaries_df(
-        s=s,
-        taxon_ids=regulated_taxon_ids,
+async def _get_non_invasive_df(s: Settings, observations_date: date):
+    """Fetch Canadian observations of all non-invasive look-alike species"""
+    non_invasive_taxon_ids = [
+        specie.id for specie in s.species_data.non_invasive if specie.id
+    ]
+    if not non_invasive_taxon_ids:
+        return None
+    df = await get_observation_summaries_df(
+        s,
+        taxon_ids=non_invasive_taxon_ids,
         date_on=observations_date,
         area=s.areas.CA,
     )
-    log.info(f"Retrieved {len(ca_summaries_df)} Canadian observations")
+    log.info(f"Retrieved {len(df)} non-invasive species observations")
+    return df
 
-    # Initialize ML predictions and filter initial dataset
-    ca_summaries_df[s.ml_column] = ""
-    ca_summaries_df = exclude_non_invasive(s, ca_summaries_df)
-    log.info(
-        f"Filtered to {len(ca_summaries_df)} Canadian observations after excluding non-invasive species"
-    )
 
-    # Process non-invasive species
-    # Get observations for each non-invasive species, predict their class,
-    # and keep only those incorrectly predicted as invasive
-    log.info("Processing non-invasive species observations")
-    for non_invasive_specie in tqdm(
-        s.species_data.non_invasive, desc="Processing non-invasive species"
-    ):
-        if not non_invasive_specie.id:
-            continue
-        df = await get_observation_summaries_df(
-            s,
-            taxon_ids=[non_invasive_specie.id],
-            date_on=observations_date,
-            area=s.areas.CA,
-        )
-        df[s.ml_column] = predict_invasiveness(
-            s, df[s.image_column], model, PredictionLabel.NON_INVASIVE
+def _predict_ca_summaries(
+    s: Settings,
+    ca_summaries_df: pd.DataFrame,
+    non_invasive_df: pd.DataFrame | None,
+    model,
+):
+    """Add ML predictions to Canadian observations, CPU bound"""
+    # Predict the class of non-invasive species observations and keep only
+    # those incorrectly predicted as invasive
+    if non_invasive_df is not None:
+        log.info("Processing non-invasive species observations")
+        non_invasive_df[s.ml_column] = predict_invasiveness(
+            s, non_invasive_df[s.image_column], model, PredictionLabel.NON_INVASIVE
         )
-        df = df[df[s.ml_column] == PredictionLabel.INVASIVE.value].reset_index(
-            drop=True
+        non_invasive_df = non_invasive_df[
+            non_invasive_df[s.ml_column] == PredictionLabel.INVASIVE.value
+        ]
+        ca_summaries_df = pd.concat(
+            [ca_summaries_df, non_invasive_df], ignore_index=True
         )
-        ca_summaries_df = pd.concat([ca_summaries_df, df], ignore_index=True)
 
-    # Process invasive species
     # For each invasive species in the dataset, predict whether their
     # images match expected invasive characteristics
     log.info("Processing invasive species observations")
@@ -140,12 +124,49 @@ async def generate_and_send_observation_report(s: Settings):
         ca_summaries_df.loc[
             ca_summaries_df[s.name_alt_column] == invasive_specie.name, s.ml_column
         ] = predict_invasiveness(s, images, model, PredictionLabel.INVASIVE)
+    return ca_summaries_df
+
+
+async def _get_ca_summaries_df(
+    s: Settings,
+    observations_date: date,
+    regulated_taxon_ids_task: asyncio.Task,
+    model_task: asyncio.Task,
+    non_invasive_task: asyncio.Task,
+):
+    """Fetch, predict and format Canadian observations"""
+    log.info("Fetching Canadian observations")
+    ca_summaries_df = await get_observation_summaries_df(
+        s=s,
+        taxon_ids=await regulated_taxon_ids_task,
+        date_on=observations_date,
+        area=s.areas.CA,
+    )
+    log.info(f"Retrieved {len(ca_summaries_df)} Canadian observations")
+
+    # Initialize ML predictions and filter initial dataset
+    ca_summaries_df[s.ml_column] = ""
+    ca_summaries_df = exclude_non_invasive(s, ca_summaries_df)
+    log.info(
+        f"Filtered to {len(ca_summaries_df)} Canadian observations after excluding non-invasive species"
+    )
+
+    ca_summaries_df = await asyncio.to_thread(
+        _predict_ca_summaries,
+        s,
+        ca_summaries_df,
+        await non_invasive_task,
+        await model_task,
+    )
 
-    # Clean and format final Canadian dataset
     log.info("Cleaning and formatting Canadian observations")
-    ca_summaries_df = clean_and_format_df(s, ca_summaries_df, s.observation_columns_ca)
+    return await asyncio.to_thread(
+        clean_and_format_df, s, ca_summaries_df, s.observation_columns_ca
+    )
+
 
-    # Process US observations
+async def _get_us_summaries_df(s: Settings, observations_date: date):
+    """Fetch and format US observations"""
     log.info("Processing US observations")
     us_summaries_df = await get_observation_summaries_df(
         s=s,
@@ -154,16 +175,50 @@ async def generate_and_send_observation_report(s: Settings):
         area=s.areas.US,
     )
     log.info(f"Retrieved {len(us_summaries_df)} US observations")
-    us_summaries_df = clean_and_format_df(s, us_summaries_df, s.observation_columns_us)
+    return await asyncio.to_thread(
+        clean_and_format_df, s, us_summaries_df, s.observation_columns_us
+    )
+
+
+@log_call
+@validate_call
+async def generate_and_send_observation_report(s: Settings):
+    """Generate and send observation report email with ML predictions.
+
+    Independent stages run concurrently: the model loads in a thread while
+    the species list and observations download, and the US observations
+    are fetched and geocoded alongside the Canadian prediction work.
+    """
+    log.info("Starting observation report generation")
+    observations_date = get_yesterday()
+    log.info(f"Processing observations for date: {observations_date}")
+
+    async with asyncio.TaskGroup() as tg:
+        log.info("Loading DenseNet model")
+        model_task = tg.create_task(
+            asyncio.to_thread(load_densenet_model, s.species_classification_model_path)
+        )
+        regulated_taxon_ids_task = tg.create_task(get_specie_ids(s))
+        non_invasive_task = tg.create_task(_get_non_invasive_df(s, observations_date))
+        us_task = tg.create_task(_get_us_summaries_df(s, observations_date))
+        ca_task = tg.create_task(
+            _get_ca_summaries_df(
+                s,
+                observations_date,
+                regulated_taxon_ids_task,
+                model_task,
+                non_invasive_task,
+            )
+        )
 
     # Generate and send email report
     log.info("Sending observation report email")
     send_observation_report_email(
         s,
-        ca_summaries_df,
-        us_summaries_df,
+        ca_task.result(),
+        us_task.result(),
         observations_date,
-        error=not regulated_taxon_ids,
+        error=not regulated_taxon_ids_task.result(),
     )
 
 
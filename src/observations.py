@@ -1,19 +1,166 @@
 import asyncio
+import inspect
 import logging
+import math
+import typing
+from collections import deque
+from collections.abc import AsyncIterator, Awaitable, Iterable
+from contextlib import aclosing
 from datetime import date, datetime
+from enum import Enum
+from functools import cache
+from typing import Any, TypeVar
 
 import pandas as pd
-from inaturalist_client import ApiClient, Observation, ObservationsApi
-from pydantic import validate_call
+from inaturalist_client import Observation, ObservationsApi
+from pydantic import BaseModel, validate_call
 from tqdm.asyncio import tqdm
 
+from src.api_client import get_api_client
+from src.cache import cached_request, make_key, open_cache
 from src.custom_logging import log_call
-from src.dates import get_yesterday
+from src.dates import get_today, get_yesterday
 from src.pydantic_models import Area, ObservationSummary
+from src.rate_limit import rate_limited
 from src.settings import Settings
 
 log = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+
+class PaginationMode(str, Enum):
+    """How to walk through result pages"""
+
+    PAGE = "page"  # page=N offsets, capped by the API at api_max_results_offset
+    ID = "id"  # keyset pagination on id_above/id_below, no depth limit
+
+
+async def _iter_in_order(
+    awaitables: Iterable[Awaitable[T]], limit: int
+) -> AsyncIterator[T]:
+    """Run awaitables with at most `limit` in flight, yielding results in order"""
+    pending: deque[asyncio.Future[T]] = deque()
+    try:
+        for awaitable in awaitables:
+            pending.append(asyncio.ensure_future(awaitable))
+            if len(pending) >= limit:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+# Observation attributes used outside ObservationSummary
+EXTRA_OBSERVATION_FIELDS = [
+    ("comments_count",),
+    ("updated_at",),
+    ("comments", "created_at"),
+]
+
+
+def _nested_model(annotation) -> type[BaseModel] | None:
+    """Find the pydantic model inside an annotation like Optional[List[Photo]]"""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    for arg in typing.get_args(annotation):
+        model = _nested_model(arg)
+        if model is not None:
+            return model
+    return None
+
+
+def _api_field_path(path: tuple[str, ...]) -> list[str] | None:
+    """Translate a model attribute path to API names, None if not in Observation"""
+    model, api_path = Observation, []
+    for key in path:
+        if model is None:
+            api_path.append(key)
+            continue
+        field = model.model_fields.get(key)
+        if field is None:
+            return None
+        api_path.append(field.alias or key)
+        model = _nested_model(field.annotation)
+    return api_path
+
+
+def _to_rison_fields(paths: list[list[str]]) -> str:
+    """Render field paths as the nested RISON object the API expects"""
+    tree: dict = {}
+    for path in paths:
+        node = tree
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+            if node is True:
+                break
+        else:
+            node.setdefault(path[-1], True)
+
+    def render(node: dict) -> str:
+        items = (f"{k}:{'!t' if v is True else render(v)}" for k, v in node.items())
+        return f"({','.join(sorted(items))})"
+
+    return render(tree)
+
+
+@cache
+def _client_accepts_fields() -> bool:
+    """Whether the installed client can send `fields`, checked once"""
+    accepts = "fields" in inspect.signature(ObservationsApi.observations_get).parameters
+    if not accepts:
+        log.info(
+            "The iNaturalist client has no `fields` parameter (v1 API), "
+            "field projection and two-phase comment fetches are off."
+        )
+    return accepts
+
+
+def supports_field_projection(s: Settings) -> bool:
+    """Whether field projection is enabled and the client can send `fields`.
+
+    The v1 client cannot, so projection has no effect with it.
+    """
+    return s.api_field_projection and _client_accepts_fields()
+
+
+def supports_comment_times() -> bool:
+    """Whether the client's observations carry comment creation times"""
+    return _api_field_path(("comments", "created_at")) is not None
+
+
+@cache
+def get_observation_fields() -> str:
+    """Fields to request so the API only returns what the summaries read"""
+    paths = ObservationSummary.source_paths() + EXTRA_OBSERVATION_FIELDS
+    api_paths = [p for p in map(_api_field_path, paths) if p is not None]
+    return _to_rison_fields(api_paths)
+
+
+# Just enough to tell which observations still match a query
+ID_FIELDS = _to_rison_fields([["id"]])
+# Just enough to tell which observations have comments
+COMMENT_COUNT_FIELDS = _to_rison_fields([["id"], ["comments_count"]])
+
+
+def get_observations_cache_ttl(
+    s: Settings,
+    date_to: datetime | None,
+    date_on: date | None,
+    updated_since: datetime | None = None,
+) -> int:
+    """Cache lifetime for a query, longer when it only covers past days"""
+    if updated_since is not None:
+        # Change queries are asked again with the same watermark until
+        # something new arrives, so they must not be served stale
+        return s.api_cache_ttl_today
+    last_day = date_on or (date_to.date() if date_to else None)
+    if last_day is not None and last_day < get_today():
+        return s.api_cache_ttl_past_days
+    return s.api_cache_ttl_today
+
 
 @log_call
 @validate_call
@@ -30,28 +177,244 @@ async def get_observations(
     per_page: int = 200,
     page: int = 1,
     area: Area | None = None,
+    id_above: int | None = None,
+    id_below: int | None = None,
+    updated_since: datetime | None = None,
+    fields: str | None = None,
+    use_cache: bool = True,
 ):
-    """Fetch a single page of observations from iNaturalist API"""
-    await asyncio.sleep(s.api_request_delay)
-
-    async with ApiClient(s.inat_client_config) as api_client:
-        api_instance = ObservationsApi(api_client)
-        return await api_instance.observations_get(
-            per_page=str(per_page),
-            page=str(page),
-            created_d1=date_from,
-            created_d2=date_to,
-            created_on=date_on,
-            taxon_name=taxon_names if taxon_names else None,
-            taxon_id=[str(tid) for tid in taxon_ids] if taxon_ids else None,
-            iconic_taxa=iconic_taxa,
+    """Fetch a single page of observations from iNaturalist API.
+
+    `fields` narrows the field projection, which defaults to what the
+    summaries read. Without `use_cache` the response cache is bypassed.
+    """
+    params = {
+        "per_page": str(per_page),
+        "page": str(page),
+        "created_d1": date_from,
+        "created_d2": date_to,
+        "created_on": date_on,
+        "taxon_name": taxon_names if taxon_names else None,
+        "taxon_id": [str(tid) for tid in taxon_ids] if taxon_ids else None,
+        "iconic_taxa": iconic_taxa,
+        "order": order,
+        "order_by": order_by,
+        "nelat": area.nelat if area else None,
+        "nelng": area.nelng if area else None,
+        "swlat": area.swlat if area else None,
+        "swlng": area.swlng if area else None,
+        "id_above": str(id_above) if id_above else None,
+        "id_below": str(id_below) if id_below else None,
+        "updated_since": updated_since,
+    }
+    api_instance = ObservationsApi(get_api_client(s))
+    if supports_field_projection(s):
+        params["fields"] = fields or get_observation_fields()
+
+    def request():
+        return rate_limited(s, lambda: api_instance.observations_get(**params))
+
+    if not use_cache:
+        return await request()
+    return await cached_request(
+        s,
+        "observations",
+        params,
+        get_observations_cache_ttl(s, date_to, date_on, updated_since),
+        request,
+    )
+
+
+def _page_size(s: Settings, per_page: int, remaining: int) -> int:
+    """Switch to the largest page size when many more pages are expected"""
+    pages_left = math.ceil(remaining / per_page)
+    if per_page < s.api_max_per_page and pages_left > s.api_max_concurrency:
+        return s.api_max_per_page
+    return per_page
+
+
+async def _iter_offset_pages(
+    s: Settings,
+    filters: dict[str, Any],
+    total_results: int,
+    per_page: int,
+    start_page: int = 1,
+) -> AsyncIterator:
+    """Yield numbered pages, fetching up to api_max_concurrency at once"""
+    last_page = math.ceil(total_results / per_page)
+    max_page = s.api_max_results_offset // per_page
+    if last_page > max_page:
+        log.warning(
+            f"Only the first {max_page * per_page} of {total_results} "
+            "observations are reachable with page pagination."
+        )
+        last_page = max_page
+
+    fetches = (
+        get_observations(**filters, per_page=per_page, page=page)
+        for page in range(start_page, last_page + 1)
+    )
+    async with aclosing(_iter_in_order(fetches, s.api_max_concurrency)) as pages:
+        async for observations in pages:
+            yield observations
+
+
+async def _iter_id_pages(
+    filters: dict[str, Any],
+    order: str | None,
+    per_page: int,
+    id_above: int | None = None,
+    cursor: int | None = None,
+) -> AsyncIterator:
+    """Yield pages sorted by id, using the last id seen as the next cursor.
+
+    A given `cursor` resumes after a page already fetched in id order.
+    """
+    descending = order != "asc"
+    while True:
+        observations = await get_observations(
+            **filters,
+            order="desc" if descending else "asc",
+            order_by="id",
+            per_page=per_page,
+            page=1,
+            id_above=id_above if descending else cursor or id_above,
+            id_below=cursor if descending else None,
+        )
+        yield observations
+        if not observations.results or len(observations.results) < per_page:
+            return
+        cursor = observations.results[-1].id
+        remaining = observations.total_results - len(observations.results)
+        per_page = _page_size(filters["s"], per_page, remaining)
+
+
+@validate_call
+async def iter_observations(
+    s: Settings,
+    taxon_ids: list[int] | None = None,
+    taxon_names: list[str] | None = None,
+    iconic_taxa: list[str] | None = None,
+    order: str | None = None,
+    order_by: str | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    date_on: date | None = None,
+    per_page: int = 200,
+    area: Area | None = None,
+    id_above: int | None = None,
+    updated_since: datetime | None = None,
+    pagination: PaginationMode | None = None,
+    fields: str | None = None,
+    use_cache: bool = True,
+) -> AsyncIterator[list[Observation]]:
+    """Yield pages of observations matching criteria as they arrive"""
+    filters = {
+        "s": s,
+        "taxon_ids": taxon_ids,
+        "taxon_names": taxon_names,
+        "iconic_taxa": iconic_taxa,
+        "date_from": date_from,
+        "date_to": date_to,
+        "date_on": date_on,
+        "area": area,
+        "updated_since": updated_since,
+        "fields": fields,
+        "use_cache": use_cache,
+    }
+
+    skip = 0
+    seen: set[int] = set()
+    if pagination == PaginationMode.ID:
+        log.debug("Fetching observations with id pagination")
+        pages = _iter_id_pages(filters, order, per_page, id_above)
+    else:
+        # The first full page gives the total and is also the first batch.
+        # Without another sort key it is sorted by id, so an id scan can
+        # carry on from its last id.
+        id_ordered = order_by in (None, "id")
+        first_page = await get_observations(
+            **filters,
             order=order,
-            order_by=order_by,
-            nelat=area.nelat if area else None,
-            nelng=area.nelng if area else None,
-            swlat=area.swlat if area else None,
-            swlng=area.swlng if area else None,
+            order_by="id" if id_ordered else order_by,
+            per_page=per_page,
+            page=1,
+            id_above=id_above,
         )
+        total_results = first_page.total_results if first_page.results else 0
+        if total_results == 0:
+            log.debug("No observations found.")
+            return
+        yield first_page.results
+        remaining = total_results - len(first_page.results)
+        next_per_page = _page_size(s, per_page, remaining)
+        # Id pagination only when page offsets cannot reach every result
+        if pagination is None and total_results > s.api_max_results_offset:
+            log.debug(f"Fetching {total_results} observations with id pagination")
+            if id_ordered:
+                cursor = first_page.results[-1].id
+            else:
+                # Pages come back in another order, skip what was yielded
+                cursor = None
+                seen = {o.id for o in first_page.results}
+            pages = _iter_id_pages(filters, order, next_per_page, id_above, cursor)
+        else:
+            log.debug(f"Fetching {total_results} observations with page pagination")
+            filters.update(
+                order=order,
+                order_by="id" if id_ordered else order_by,
+                id_above=id_above,
+            )
+            if next_per_page == per_page:
+                pages = _iter_offset_pages(
+                    s, filters, total_results, per_page, start_page=2
+                )
+            else:
+                # Larger pages restart at the top, skip what was already yielded
+                skip = len(first_page.results)
+                pages = _iter_offset_pages(s, filters, total_results, next_per_page)
+
+    async with aclosing(pages) as it:
+        async for observations in it:
+            if not observations.results:
+                log.debug("No more observations to fetch.")
+                return
+            results, skip = observations.results[skip:], 0
+            if seen:
+                results = [o for o in results if o.id not in seen]
+            if results:
+                yield results
+
+
+@validate_call
+async def get_observations_by_ids(s: Settings, ids: list[int]) -> list[Observation]:
+    """Fetch full observations by id with the multi-id endpoint.
+
+    Ids are sent api_ids_per_request at a time, up to api_max_concurrency
+    requests at once, and results come back in chunk order.
+    """
+    api_instance = ObservationsApi(get_api_client(s))
+    chunks = [
+        ids[i : i + s.api_ids_per_request]
+        for i in range(0, len(ids), s.api_ids_per_request)
+    ]
+
+    def fetch(chunk: list[int]):
+        return cached_request(
+            s,
+            "observations_by_id",
+            {"id": chunk},
+            s.api_cache_ttl_today,
+            lambda: rate_limited(s, lambda: api_instance.observations_id_get(chunk)),
+        )
+
+    observations = []
+    fetches = (fetch(chunk) for chunk in chunks)
+    async with aclosing(_iter_in_order(fetches, s.api_max_concurrency)) as pages:
+        async for page in pages:
+            observations.extend(page.results or [])
+    log.debug(f"Fetched {len(observations)} of {len(ids)} observations by id")
+    return observations
 
 
 @log_call
@@ -68,10 +431,14 @@ async def get_all_observations(
     date_on: date | None = None,
     per_page: int = 200,
     area: Area | None = None,
+    id_above: int | None = None,
+    updated_since: datetime | None = None,
+    pagination: PaginationMode | None = None,
+    fields: str | None = None,
+    use_cache: bool = True,
 ):
-    """Fetch all observations matching criteria with pagination"""
-    # Get first page to determine total results
-    first_page = await get_observations(
+    """Fetch all observations matching criteria, see iter_observations"""
+    pages = iter_observations(
         s=s,
         taxon_ids=taxon_ids,
         taxon_names=taxon_names,
@@ -81,64 +448,141 @@ async def get_all_observations(
         date_from=date_from,
         date_to=date_to,
         date_on=date_on,
-        per_page=1,
-        page=1,
+        per_page=per_page,
         area=area,
+        id_above=id_above,
+        updated_since=updated_since,
+        pagination=pagination,
+        fields=fields,
+        use_cache=use_cache,
     )
 
-    total_results = first_page.total_results if first_page.results else 0
-    if total_results == 0:
-        log.debug("No observations found.")
-        return []
-
     all_observations: list[Observation] = []
-    page = 1
-
-    # Fetch all pages with progress bar
-    with tqdm(total=total_results, desc="Fetching observations") as pbar:
-        while True:
-            observations = await get_observations(
-                s=s,
-                taxon_ids=taxon_ids,
-                taxon_names=taxon_names,
-                iconic_taxa=iconic_taxa,
-                order=order,
-                order_by=order_by,
-                date_from=date_from,
-                date_to=date_to,
-                date_on=date_on,
-                per_page=per_page,
-                page=page,
-                area=area,
-            )
+    with tqdm(desc="Fetching observations", unit="obs") as pbar:
+        async with aclosing(pages) as it:
+            async for page in it:
+                all_observations.extend(page)
+                pbar.update(len(page))
 
-            if not observations.results:
-                log.debug("No more observations to fetch.")
-                break
+    log.debug("All observations retrieved.")
+    return all_observations
 
-            all_observations.extend(observations.results)
-            pbar.update(len(observations.results))
 
-            if len(all_observations) >= total_results:
-                log.debug("All observations retrieved.")
-                break
+async def _drop_unmatched(
+    s: Settings, filters: dict[str, Any], merged: dict[int, Observation]
+) -> list[Observation]:
+    """Keep only the merged rows the query still returns"""
+    # Both queries skip the response cache, a cached answer would bring
+    # back the rows they are meant to drop
+    count_page = await get_observations(s=s, **filters, per_page=1, use_cache=False)
+    total_results = count_page.total_results if count_page.results else 0
+    if total_results == len(merged):
+        return list(merged.values())
+
+    if not supports_field_projection(s):
+        # No id-only query without projection, so fetch the rows afresh
+        log.info(
+            f"Stored {len(merged)} observations but the query has "
+            f"{total_results}, fetching them again."
+        )
+        return await get_all_observations(s=s, **filters, use_cache=False)
 
-            page += 1
+    log.debug(
+        f"Stored {len(merged)} observations but the query has {total_results}, "
+        "reconciling ids."
+    )
+    matching = await get_all_observations(
+        s=s, **filters, fields=ID_FIELDS, use_cache=False
+    )
+    ids = {o.id for o in matching}
+    return [o for o_id, o in merged.items() if o_id in ids]
 
-    return all_observations
+
+@log_call
+@validate_call
+async def get_all_observations_incremental(
+    s: Settings,
+    taxon_ids: list[int] | None = None,
+    taxon_names: list[str] | None = None,
+    iconic_taxa: list[str] | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    date_on: date | None = None,
+    area: Area | None = None,
+):
+    """Fetch all observations matching criteria, downloading only what changed"""
+    filters = {
+        "taxon_ids": taxon_ids,
+        "taxon_names": taxon_names,
+        "iconic_taxa": iconic_taxa,
+        "date_from": date_from,
+        "date_to": date_to,
+        "date_on": date_on,
+        "area": area,
+    }
+    # Rows of the last run and their high-water marks, kept per query
+    store = open_cache(
+        s.incremental_state_file, max_entries=s.incremental_state_max_entries
+    )
+    key = make_key(
+        "observations_state", {**filters, "area": area.model_dump() if area else None}
+    )
+
+    state = store.get(key)
+    if state is None:
+        log.debug("No incremental state found, fetching all observations.")
+        observations = await get_all_observations(s=s, **filters)
+    else:
+        # Only ask for what was updated since the last run, or for higher ids
+        # when no update time is known, and merge it by id
+        log.debug(
+            f"Fetching observations since id {state['max_id']} / "
+            f"update {state['updated_at']}"
+        )
+        delta = await get_all_observations(
+            s=s,
+            **filters,
+            updated_since=state["updated_at"],
+            id_above=None if state["updated_at"] else state["max_id"],
+        )
+        merged = {o.id: o for o in state["observations"]}
+        merged.update((o.id, o) for o in delta)
+        log.debug(f"Merged {len(delta)} new or updated observations.")
+        # Rows that stopped matching (deleted, re-identified or moved away)
+        # are not in the delta
+        observations = await _drop_unmatched(s, filters, merged)
+
+    updated_at = [o.updated_at for o in observations if getattr(o, "updated_at", None)]
+    store.set(
+        key,
+        {
+            "max_id": max((o.id for o in observations), default=None),
+            "updated_at": max(updated_at, default=None),
+            "observations": observations,
+        },
+        ttl=s.incremental_state_ttl,
+    )
+    return observations
 
 
 @log_call
 @validate_call
 def transform_summaries_to_df(
-    summaries: list[ObservationSummary], column_mapping: dict[str, str]
+    summaries: list[ObservationSummary],
+    column_mapping: dict[str, str],
+    include_cleaned_comments: bool = False,
 ) -> pd.DataFrame:
-    """Convert observation summaries to DataFrame with mapped column names"""
+    """Convert observation summaries to DataFrame with mapped column names.
+
+    Cleaned comments are only added as a column when asked for.
+    """
     # Validate column mapping
     if len(set(column_mapping.values())) != len(column_mapping.values()):
         raise ValueError("Duplicate output column names in mapping")
 
-    model_keys = ObservationSummary(id=0).model_dump().keys()
+    model_keys = list(ObservationSummary.model_fields)
+    if include_cleaned_comments:
+        model_keys.append("cleaned_comments")
     invalid_keys = set(column_mapping.keys()) - set(model_keys)
     if invalid_keys:
         raise KeyError(f"Invalid column mapping keys: {invalid_keys}")
@@ -147,8 +591,9 @@ def transform_summaries_to_df(
 
     # Convert summaries to DataFrame rows
     if summaries:
-        data = [summary.model_dump() for summary in summaries]
-        df = pd.DataFrame(data)
+        df = pd.DataFrame([summary.model_dump() for summary in summaries])
+        if include_cleaned_comments:
+            df["cleaned_comments"] = [s.cleaned_comments for s in summaries]
 
     return df.rename(columns=column_mapping)
 
@@ -163,22 +608,40 @@ async def get_observation_summaries_df(
     date_on: date | None = None,
     area: Area | None = None,
 ):
-    """Fetch observations and return as DataFrame with summary data"""
+    """Fetch observations and return as DataFrame with summary data.
+
+    Taxon ids are queried together, api_taxon_ids_per_query at a time, and
+    observations matched by several chunks (nested taxa) are kept once.
+    """
     if not taxon_ids:
         return transform_summaries_to_df([], s.df_column_map_default)
 
-    observations = await get_all_observations(
-        s=s,
-        taxon_ids=taxon_ids,
-        date_from=date_from,
-        date_to=date_to,
-        date_on=date_on,
-        area=area,
-    )
-    summaries = [
-        ObservationSummary.model_validate(o.model_dump()) for o in observations
-    ]
-    return transform_summaries_to_df(summaries, s.df_column_map_default)
+    summaries: dict[int, ObservationSummary] = {}
+    for i in range(0, len(taxon_ids), s.api_taxon_ids_per_query):
+        filters = {
+            "s": s,
+            "taxon_ids": taxon_ids[i : i + s.api_taxon_ids_per_query],
+            "date_from": date_from,
+            "date_to": date_to,
+            "date_on": date_on,
+            "area": area,
+        }
+        if s.incremental_fetch:
+            observations = await get_all_observations_incremental(**filters)
+            summaries.update(
+                (o.id, ObservationSummary.model_validate(o.model_dump()))
+                for o in observations
+            )
+            continue
+
+        # Summarise each page while the next ones are still downloading
+        async with aclosing(iter_observations(**filters)) as pages:
+            async for page in pages:
+                summaries.update(
+                    (o.id, ObservationSummary.model_validate(o.model_dump()))
+                    for o in page
+                )
+    return transform_summaries_to_df(list(summaries.values()), s.df_column_map_default)
 
 
 if __name__ == "__main__":
@@ -1,17 +1,95 @@
 import logging
-import re
+from itertools import compress
 
+import numpy as np
 import pandas as pd
 from pydantic import validate_call
 
+from src.comment_flags import get_comment_matcher
 from src.custom_logging import log_call
-from src.geo import get_city_province_country
-from src.pydantic_models import ObservationSummary
+from src.geo import get_countries, get_locations, get_locations_async
+from src.pydantic_models import (
+    COMMENT_EMOJI_RE,
+    COMMENT_PUNCTUATION_RE,
+    ObservationSummary,
+)
 from src.settings import Settings
 
 log = logging.getLogger(__name__)
 
 
+def _get_row_points(coordinates: list):
+    """Distinct (lat, lon) points of the rows, with each row's point code"""
+    has_point = np.array([c is not None and len(c) >= 2 for c in coordinates])
+    points = [(c[0], c[1]) for c in compress(coordinates, has_point)]
+    if not points:
+        return has_point, np.array([], dtype=int), []
+    codes, unique = pd.MultiIndex.from_tuples(points).factorize()
+    log.debug(f"Geocoding {len(unique)} distinct locations for {len(points)} rows")
+    return has_point, codes, [(lat, lon) for lon, lat in unique]
+
+
+def _broadcast_locations(
+    has_point: np.ndarray, codes: np.ndarray, locations: list
+) -> np.ndarray:
+    """(city, province, country) table of the rows; empty without a point"""
+    table = np.full((len(has_point), 3), "", dtype=object)
+    if locations:
+        table[has_point] = np.array(locations, dtype=object).reshape(-1, 3)[codes]
+    return table
+
+
+def _get_row_locations(s: Settings, coordinates: list) -> np.ndarray:
+    """Geocode each distinct (lon, lat) once and broadcast back to every row"""
+    has_point, codes, points = _get_row_points(coordinates)
+    locations = get_locations(s, points) if points else []
+    return _broadcast_locations(has_point, codes, locations)
+
+
+async def _get_row_locations_async(s: Settings, coordinates: list) -> np.ndarray:
+    """Like _get_row_locations, without blocking the event loop on Nominatim"""
+    has_point, codes, points = _get_row_points(coordinates)
+    locations = await get_locations_async(s, points) if points else []
+    return _broadcast_locations(has_point, codes, locations)
+
+
+def _may_be_in_countries(
+    s: Settings, coordinates: list, countries: list[str]
+) -> np.ndarray:
+    """Rows inside `countries`, near a border or without coordinates"""
+    points = [
+        (c[1], c[0]) if c is not None and len(c) >= 2 else (np.nan, np.nan)
+        for c in coordinates
+    ]
+    found = get_countries(s, points)
+    return np.array([c is None or c in countries for c in found], dtype=bool)
+
+
+@log_call
+@validate_call(config=dict(arbitrary_types_allowed=True))
+def prefilter_ca_us_locations(s: Settings, df: pd.DataFrame):
+    """Drop rows the bundled boundaries place clearly outside Canada and the US"""
+    if not s.country_prefilter or df.empty:
+        return df
+    keep = _may_be_in_countries(s, df[s.coords_column].tolist(), ["ca", "us"])
+    log.debug(f"Country prefilter kept {keep.sum()} of {len(df)} rows")
+    return df[keep].reset_index(drop=True)
+
+
+@log_call
+@validate_call
+def prefilter_summaries_by_country(
+    s: Settings, summaries: list[ObservationSummary], country: str
+):
+    """Drop summaries the bundled boundaries place clearly outside a country"""
+    if not s.country_prefilter or not summaries:
+        return summaries
+    coordinates = [summary.coordinates for summary in summaries]
+    keep = _may_be_in_countries(s, coordinates, [country])
+    log.debug(f"Country prefilter kept {keep.sum()} of {len(summaries)} summaries")
+    return list(compress(summaries, keep))
+
+
 @log_call
 @validate_call(config=dict(arbitrary_types_allowed=True))
 def add_location_details_df(s: Settings, df: pd.DataFrame):
@@ -23,13 +101,8 @@ def add_location_details_df(s: Settings, df: pd.DataFrame):
         log.debug("Input DataFrame is empty.")
         return df
 
-    locations = [
-        get_city_province_country(s, lat, lon) for lon, lat in df[s.coords_column]
-    ]
-    if not locations:
-        return df[[s.coords_column]].drop(columns=[s.coords_column])
-
-    cities, provinces, countries = zip(*locations) if locations else ([], [], [])
+    locations = _get_row_locations(s, df[s.coords_column].tolist())
+    cities, provinces, countries = locations.T
 
     df[s.city_column] = cities
     df[s.province_column] = provinces
@@ -43,12 +116,32 @@ def add_location_details_df(s: Settings, df: pd.DataFrame):
 def add_location_details(s: Settings, summary: ObservationSummary):
     """Add city, province and country based on coordinates to an ObservationSummary"""
     if summary.coordinates:
-        summary.city, summary.province, summary.country = get_city_province_country(
-            s, summary.coordinates[1], summary.coordinates[0]
-        )
+        lon, lat = summary.coordinates[:2]
+        summary.city, summary.province, summary.country = get_locations(
+            s, [(lat, lon)]
+        )[0]
     return summary
 
 
+def _set_locations(summaries: list[ObservationSummary], locations: np.ndarray):
+    for summary, (city, province, country) in zip(summaries, locations):
+        summary.city, summary.province, summary.country = city, province, country
+
+
+@log_call
+@validate_call
+async def add_location_details_batch_async(
+    s: Settings, summaries: list[ObservationSummary]
+):
+    """Add city, province and country to summaries, geocoding each point once"""
+    located = [summary for summary in summaries if summary.coordinates]
+    locations = await _get_row_locations_async(
+        s, [summary.coordinates for summary in located]
+    )
+    _set_locations(located, locations)
+    return summaries
+
+
 @log_call
 @validate_call(config=dict(arbitrary_types_allowed=True))
 def filter_ca_us_locations(s: Settings, df: pd.DataFrame):
@@ -120,6 +213,7 @@ def exclude_non_invasive(s: Settings, df: pd.DataFrame):
 def clean_and_format_df(s: Settings, df: pd.DataFrame, columns: list[str]):
     """Clean and format DataFrame by removing duplicates, adding locations, filtering and sorting"""
     df = df.drop_duplicates(subset=[s.observation_id_column]).reset_index(drop=True)
+    df = prefilter_ca_us_locations(s, df)
     df = add_location_details_df(s, df)
     df = filter_ca_us_locations(s, df)
     df = df[columns]
@@ -128,29 +222,58 @@ def clean_and_format_df(s: Settings, df: pd.DataFrame, columns: list[str]):
 
 
 @log_call
-@validate_call
-def flag_comments(s: Settings, summary: ObservationSummary):
-    """Flag comments containing specified terms in an observation summary"""
-    if not summary.cleaned_comments:
-        summary.flagged_comments = []
-        summary.flagged_terms = []
-        return summary
+@validate_call(config=dict(arbitrary_types_allowed=True))
+def flag_comments_df(s: Settings, df: pd.DataFrame):
+    """Flag a table of comments in bulk.
 
-    pattern = re.compile(
-        r"\b(" + "|".join(map(re.escape, s.comment_flags)) + r")\b", re.IGNORECASE
+    `df` has one row per comment with observation id and comment columns.
+    Returns the flagged rows with the cleaned comment and its list of terms.
+    """
+    columns = [s.observation_id_column, s.flagged_comments_column]
+    if df.empty:
+        return pd.DataFrame(columns=columns + [s.flagged_terms_column])
+
+    cleaned = (
+        df[s.comment_column]
+        .fillna("")
+        .str.lower()
+        .str.replace(COMMENT_PUNCTUATION_RE, "", regex=True)
+        .str.replace(COMMENT_EMOJI_RE, "", regex=True)
+        .str.strip()
     )
+    terms = get_comment_matcher(s).match_comments(cleaned.tolist())
+    flagged = pd.DataFrame(
+        {
+            s.observation_id_column: df[s.observation_id_column].to_numpy(),
+            s.flagged_comments_column: cleaned.to_numpy(),
+            s.flagged_terms_column: [list(dict.fromkeys(found)) for found in terms],
+        }
+    )
+    flagged = flagged[flagged[s.flagged_terms_column].str.len() > 0]
+    log.debug(f"Flagged {len(flagged)} of {len(df)} comments")
+    return flagged.reset_index(drop=True)
 
-    flagged_comments = []
-    flagged_terms = set()
-
-    for comment in summary.cleaned_comments:
-        matches = pattern.findall(comment)
-        if matches:
-            flagged_comments.append(comment)
-            flagged_terms.update(matches)
 
-    summary.flagged_comments = flagged_comments
-    summary.flagged_terms = list(flagged_terms)
+@log_call
+@validate_call
+def flag_comments(s: Settings, summary: ObservationSummary):
+    """Flag comments containing specified terms in an observation summary"""
+    comments = summary.comments or []
+    flagged = flag_comments_df(
+        s,
+        pd.DataFrame(
+            {
+                s.observation_id_column: [summary.id] * len(comments),
+                s.comment_column: comments,
+            }
+        ),
+    )
+    summary.flagged_comments = flagged[s.flagged_comments_column].tolist()
+    summary.flagged_terms = list(
+        dict.fromkeys(
+            term for terms in flagged[s.flagged_terms_column] for term in terms
+        )
+    )
     return summary
 
 
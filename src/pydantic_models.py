@@ -1,15 +1,22 @@
 import re
 from datetime import datetime
+from functools import cached_property
+from typing import ClassVar
 
 from pydantic import (
     AliasChoices,
     AliasPath,
     BaseModel,
     Field,
-    computed_field,
     field_validator,
 )
 
+# Comment cleaning: punctuation first, then emojis
+COMMENT_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+COMMENT_EMOJI_RE = re.compile(
+    r"[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF\U00002702-\U000027B0\U000024C2-\U0001F251]+"
+)
+
 
 class Species(BaseModel):
     """Model for species data with optional name and ID"""
@@ -94,6 +101,27 @@ class ObservationSummary(BaseModel):
     province: str | None = None
     country: str | None = None
 
+    # Keys read inside the objects of list fields by the validators below
+    source_subfields: ClassVar[dict[str, list[str]]] = {
+        "image_urls": ["url"],
+        "comments": ["body"],
+    }
+
+    @classmethod
+    def source_paths(cls) -> list[tuple[str, ...]]:
+        """Payload paths a summary can be validated from, taken from the aliases"""
+        paths = []
+        for name, field in cls.model_fields.items():
+            alias = field.validation_alias
+            choices = alias.choices if isinstance(alias, AliasChoices) else [name]
+            for choice in choices:
+                path = (
+                    tuple(choice.path) if isinstance(choice, AliasPath) else (choice,)
+                )
+                subfields = cls.source_subfields.get(name, [])
+                paths.extend([path + (sub,) for sub in subfields] or [path])
+        return paths
+
     @field_validator("image_urls", mode="before")
     @classmethod
     def extract_image_urls(cls, value: list[str]):
@@ -116,21 +144,26 @@ class ObservationSummary(BaseModel):
         if isinstance(value, list):
             return [v["body"] if isinstance(v, dict) else v for v in value]
 
-    @computed_field
-    @property
+    @cached_property
     def cleaned_comments(self) -> list[str] | None:
-        """Clean comments by removing emojis and special characters"""
+        """Comments without emojis and special characters, cleaned once.
+
+        Not part of model_dump(); reset when `comments` is reassigned.
+        """
         if not self.comments:
             return None
         return [
-            re.sub(
-                r"[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF\U00002702-\U000027B0\U000024C2-\U0001F251]+",
-                "",
-                re.sub(r"[^\w\s]", "", comment.lower()),
+            COMMENT_EMOJI_RE.sub(
+                "", COMMENT_PUNCTUATION_RE.sub("", comment.lower())
             ).strip()
             for comment in self.comments
         ]
 
+    def __setattr__(self, name: str, value):
+        super().__setattr__(name, value)
+        if name == "comments":
+            self.__dict__.pop("cleaned_comments", None)
+
 
 class EmailTable(BaseModel):
     """Email table with title and HTML content"""
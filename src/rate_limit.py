@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+from typing import TypeVar
+
+from inaturalist_client.exceptions import ApiException
+
+from src.settings import Settings
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUSES = {429, 503}
+
+
+class TokenBucket:
+    """Async token bucket allowing `rate` requests per second with bursts.
+
+    Tokens may go negative: each caller reserves its slot immediately and
+    sleeps until it is due. A lock only guards the bookkeeping, so worker
+    threads can share a bucket with coroutines. Throttling responses halve
+    the rate and pause every caller; each success then restores a tenth of
+    the configured rate.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        # Tokens accrue from this time on; it lies in the future while paused
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            elapsed = now - self.updated
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def _reserve(self) -> float:
+        """Take a token and return how long to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            return max(self.updated - now, 0.0) + max(-self.tokens / self.rate, 0.0)
+
+    async def acquire(self):
+        """Wait until a request may be sent"""
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def acquire_blocking(self):
+        """Like acquire, sleeping the calling thread"""
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def throttled(self, delay: float):
+        """Pause all callers for `delay` seconds and slow down afterwards"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens = min(self.tokens, 1.0)
+            self.updated = max(self.updated, now + delay)
+            self.rate = max(self.rate / 2, self.max_rate / 16)
+
+    def succeeded(self):
+        """Recover part of the configured rate after a successful request"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+_buckets: dict[tuple[str, float, int], TokenBucket] = {}
+
+
+def get_rate_limiter(s: Settings) -> TokenBucket:
+    """Get the token bucket shared by all requests to the iNaturalist host"""
+    key = (s.inat_host, s.api_requests_per_second, s.api_burst)
+    if key not in _buckets:
+        _buckets[key] = TokenBucket(s.api_requests_per_second, s.api_burst)
+    return _buckets[key]
+
+
+# In-flight request slots keyed by event loop and host, shared by every
+# pipeline running on the loop
+_request_slots: dict[tuple[asyncio.AbstractEventLoop, str, int], asyncio.Semaphore] = {}
+
+
+def get_request_slots(s: Settings) -> asyncio.Semaphore:
+    """Get the semaphore capping in-flight requests to the iNaturalist host"""
+    key = (asyncio.get_running_loop(), s.inat_host, s.api_max_concurrency)
+    if key not in _request_slots:
+        _request_slots[key] = asyncio.Semaphore(s.api_max_concurrency)
+    return _request_slots[key]
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Parse a Retry-After header given in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(UTC)).total_seconds(), 0.0)
+
+
+async def rate_limited(s: Settings, request: Callable[[], Awaitable[T]]) -> T:
+    """Send `request` through the host rate limiter, retrying on 429/503.
+
+    At most api_max_concurrency requests are in flight on the running loop,
+    however many pipelines share it.
+    """
+    bucket = get_rate_limiter(s)
+    for attempt in range(s.api_max_retries + 1):
+        try:
+            async with get_request_slots(s):
+                await bucket.acquire()
+                result = await request()
+        except ApiException as e:
+            if e.status not in RETRYABLE_STATUSES or attempt == s.api_max_retries:
+                raise
+            retry_after = parse_retry_after((e.headers or {}).get("Retry-After"))
+            delay = (
+                retry_after
+                if retry_after is not None
+                else s.api_retry_backoff * 2**attempt
+            )
+            log.warning(
+                f"iNaturalist API returned {e.status}, retrying in {delay:.1f}s "
+                f"(attempt {attempt + 1}/{s.api_max_retries})"
+            )
+            bucket.throttled(delay)
+            continue
+        bucket.succeeded()
+        return result
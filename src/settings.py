@@ -17,6 +17,13 @@ class AppEnvironment(str, Enum):
     DEVELOPMENT = "dev"
 
 
+class GeocoderBackend(str, Enum):
+    """Reverse geocoding backends"""
+
+    OFFLINE = "offline"
+    NOMINATIM = "nominatim"
+
+
 class Settings(BaseSettings):
     """Main settings class containing all configuration"""
 
@@ -25,9 +32,62 @@ class Settings(BaseSettings):
     number_days_back: int = 7
     nominatim_user_agent: str = "inectsiNatApp"
 
+    # Geocoding settings (offline gazetteer, optionally falling back to
+    # Nominatim for points far from any known place)
+    geocoder: GeocoderBackend = GeocoderBackend.OFFLINE
+    geocoder_nominatim_fallback: bool = False
+    geocoder_fallback_distance_km: float = 50.0
+
+    # Nominatim settings (point the domain at a self-hosted instance to
+    # raise the concurrency and rate limits of the public server)
+    nominatim_domain: str = "nominatim.openstreetmap.org"
+    nominatim_scheme: str = "https"
+    nominatim_timeout: float = 10.0
+    nominatim_max_concurrency: int = 1
+    nominatim_requests_per_second: float = 1.0
+
+    # Country prefilter with bundled simplified CA/US boundaries, points
+    # closer than the buffer to a border are left to the geocoder
+    country_prefilter: bool = True
+    country_boundaries_file: str = "data/country_boundaries.geojson"
+    country_border_buffer_km: float = 30.0
+
+    # Geocode cache settings (Nominatim results keyed by rounded coordinates,
+    # 3 decimals is about 100 m)
+    geocode_cache_enabled: bool = True
+    geocode_cache_file: str = "cache/geocode.sqlite"
+    geocode_cache_precision: int = 3
+    geocode_cache_max_entries: int = 200_000
+
     # API settings
     inat_host: str = "https://api.inaturalist.org/v1"
-    api_request_delay: float = 3.0
+    api_requests_per_second: float = 1.0
+    api_burst: int = 5
+    api_max_retries: int = 5
+    api_retry_backoff: float = 2.0
+    # Only takes effect with a client whose observations_get accepts
+    # `fields`; the v1 client does not, so it is off by default
+    api_field_projection: bool = False
+    api_max_concurrency: int = 4
+    api_pool_size: int = 10
+    api_max_results_offset: int = 10000
+    api_max_per_page: int = 200
+    api_taxon_ids_per_query: int = 100
+    api_ids_per_request: int = 100
+
+    # API response cache settings (TTLs in seconds)
+    api_cache_enabled: bool = True
+    api_cache_file: str = "cache/api_responses.sqlite"
+    api_cache_max_mb: int = 256
+    api_cache_ttl_past_days: int = 20 * 60 * 60
+    api_cache_ttl_today: int = 10 * 60
+    api_cache_ttl_project: int = 24 * 60 * 60
+
+    # Incremental fetch settings (rows and watermarks kept per query)
+    incremental_fetch: bool = False
+    incremental_state_file: str = "cache/observations_state.sqlite"
+    incremental_state_ttl: int = 3 * 24 * 60 * 60
+    incremental_state_max_entries: int = 1000
 
     # Project and taxonomy settings
     project_id: str = "91863"
@@ -73,6 +133,7 @@ class Settings(BaseSettings):
     quality_column: str = "Quality Grade"
     flagged_comments_column: str = "Flagged Comments"
     flagged_terms_column: str = "Flagged Terms"
+    comment_column: str = "Comment"
 
     # Comment settings
     comment_flags: list[str] = [
@@ -88,6 +149,23 @@ class Settings(BaseSettings):
         "canadian food inspection agency",
     ]
     comments_cached_file: str = "cache/cached_comments.pkl"
+    # Scan ids and comment counts first, then fetch details of commented
+    # observations only. Needs field projection, which the v1 client does
+    # not have, so it is off by default
+    comments_two_phase_fetch: bool = False
+    comments_max_concurrent_dates: int = 3
+    comments_date_max_retries: int = 2
+    # Also flag new comments on observations older than the report period,
+    # found by update time since the last run (watermark kept in the
+    # incremental state store)
+    comments_late_scan: bool = False
+
+    # Day cache of the comments report: flagged comments kept per past date,
+    # so each run of the rolling window only processes the new day
+    comments_day_cache_enabled: bool = True
+    comments_day_cache_file: str = "cache/comments_days.sqlite"
+    comments_day_cache_ttl: int = 8 * 24 * 60 * 60
+    comments_day_cache_max_entries: int = 1000
 
     # Email settings
     smtp_host: str
@@ -186,7 +264,9 @@ class Settings(BaseSettings):
     @property
     def inat_client_config(self) -> Configuration:
         """iNaturalist API client configuration"""
-        return Configuration(host=self.inat_host, retries=5)
+        config = Configuration(host=self.inat_host, retries=5)
+        config.connection_pool_maxsize = self.api_pool_size
+        return config
 
     @computed_field
     @property
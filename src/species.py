@@ -1,9 +1,12 @@
 import logging
 
-from inaturalist_client import ApiClient, ProjectsApi
+from inaturalist_client import ProjectsApi
 from pydantic import validate_call
 
+from src.api_client import get_api_client
+from src.cache import cached_request
 from src.custom_logging import log_call
+from src.rate_limit import rate_limited
 from src.settings import Settings
 
 log = logging.getLogger(__name__)
@@ -13,24 +16,33 @@ log = logging.getLogger(__name__)
 @validate_call
 async def get_specie_ids(s: Settings):
     """Get list of species IDs from project observation rules"""
-    async with ApiClient(s.inat_client_config) as api_client:
-        # Get project details with observation rules
-        results = (
-            await ProjectsApi(api_client).projects_id_get(
-                [s.project_id], rule_details="true"
-            )
-        ).results
-        if not results:
-            log.debug("No project results found.")
-            return []
-
-        # Extract taxon IDs from rules that have them
-        ids = [
-            r.taxon.id
-            for r in results[0].project_observation_rules
-            if r.taxon and r.taxon.id
-        ]
-        return ids
+    # Get project details with observation rules
+    api_instance = ProjectsApi(get_api_client(s))
+    results = (
+        await cached_request(
+            s,
+            "projects",
+            {"id": s.project_id, "rule_details": "true"},
+            s.api_cache_ttl_project,
+            lambda: rate_limited(
+                s,
+                lambda: api_instance.projects_id_get(
+                    [s.project_id], rule_details="true"
+                ),
+            ),
+        )
+    ).results
+    if not results:
+        log.debug("No project results found.")
+        return []
+
+    # Extract taxon IDs from rules that have them
+    ids = [
+        r.taxon.id
+        for r in results[0].project_observation_rules
+        if r.taxon and r.taxon.id
+    ]
+    return ids
 
 
 if __name__ == "__main__":
@@ -8,4 +8,9 @@ settings = Settings(
     sender_email="noreply@example.com",
     observations_email_recipients=["a@example.com", "b@example.com"],
     comments_email_recipients=["x@example.com", "y@example.com"],
+    api_cache_enabled=False,
+    geocoder="nominatim",
+    geocode_cache_enabled=False,
+    country_prefilter=False,
+    comments_day_cache_enabled=False,
 )
@@ -0,0 +1,55 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from src.api_client import _api_clients, close_api_clients, get_api_client
+from tests import settings
+
+
+class TestGetApiClient(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.settings = settings.model_copy()
+
+    async def asyncTearDown(self):
+        await close_api_clients()
+
+    @patch("src.api_client.ApiClient")
+    async def test_reuses_client_within_loop(self, mock_api_client):
+        mock_api_client.return_value.close = AsyncMock()
+        first = get_api_client(self.settings)
+        second = get_api_client(self.settings)
+
+        self.assertIs(first, second)
+        mock_api_client.assert_called_once()
+        config = mock_api_client.call_args.args[0]
+        self.assertEqual(config.host, self.settings.inat_host)
+        self.assertEqual(config.connection_pool_maxsize, self.settings.api_pool_size)
+
+    @patch("src.api_client.ApiClient")
+    async def test_new_client_when_settings_change(self, mock_api_client):
+        mock_api_client.return_value.close = AsyncMock()
+        get_api_client(self.settings)
+        self.settings.inat_host = "https://api.example.org/v1"
+        self.settings.api_pool_size = 2
+        get_api_client(self.settings)
+
+        config = mock_api_client.call_args.args[0]
+        self.assertEqual(mock_api_client.call_count, 2)
+        self.assertEqual(config.host, "https://api.example.org/v1")
+        self.assertEqual(config.connection_pool_maxsize, 2)
+
+    @patch("src.api_client.ApiClient")
+    async def test_close_removes_client(self, mock_api_client):
+        mock_api_client.return_value.close = AsyncMock()
+        get_api_client(self.settings)
+
+        await close_api_clients()
+
+        mock_api_client.return_value.close.assert_awaited_once()
+        self.assertEqual(_api_clients, {})
+
+    def test_client_config_follows_settings(self):
+        self.settings.api_pool_size = 3
+        copy = self.settings.model_copy(update={"inat_host": "https://example.org"})
+
+        self.assertEqual(self.settings.inat_client_config.connection_pool_maxsize, 3)
+        self.assertEqual(copy.inat_client_config.host, "https://example.org")
@@ -0,0 +1,121 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+from unittest.mock import AsyncMock, patch
+
+from src.cache import SqliteCache, _caches, cached_request, make_key
+from tests import settings
+
+
+class TestSqliteCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_set_and_get(self):
+        cache = SqliteCache(self.path)
+        cache.set("key", {"id": 1})
+        self.assertEqual(cache.get("key"), {"id": 1})
+        self.assertIsNone(cache.get("missing"))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_persists_across_instances(self):
+        SqliteCache(self.path).set("key", [1, 2])
+        self.assertEqual(SqliteCache(self.path).get("key"), [1, 2])
+
+    def test_get_many_and_set_many(self):
+        cache = SqliteCache(self.path)
+        cache.set_many({"a": 1, "b": 2})
+
+        self.assertEqual(cache.get_many(["a", "b", "c", "a"]), {"a": 1, "b": 2})
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    @patch("src.cache.time.time")
+    def test_expired_entry_is_a_miss(self, mock_time):
+        mock_time.return_value = 1000.0
+        cache = SqliteCache(self.path)
+        cache.set("key", "value", ttl=60)
+
+        mock_time.return_value = 1059.0
+        self.assertEqual(cache.get("key"), "value")
+        mock_time.return_value = 1061.0
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(len(cache), 0)
+
+    @patch("src.cache.time.time")
+    def test_evicts_least_recently_used(self, mock_time):
+        cache = SqliteCache(self.path, max_entries=2)
+        mock_time.return_value = 1.0
+        cache.set("a", 1)
+        mock_time.return_value = 2.0
+        cache.set("b", 2)
+        mock_time.return_value = 3.0
+        cache.get("a")
+        mock_time.return_value = 4.0
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    @patch("src.cache.time.time")
+    def test_evicts_over_size_cap(self, mock_time):
+        cache = SqliteCache(self.path, max_bytes=250)
+        for i in range(5):
+            mock_time.return_value = float(i)
+            cache.set(f"key{i}", "x" * 100)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(cache.get("key4"))
+
+
+class TestMakeKey(unittest.TestCase):
+    def test_normalizes_params(self):
+        self.assertEqual(
+            make_key("observations", {"taxon_id": ["2", "1"], "order": None}),
+            make_key("observations", {"taxon_id": ["1", "2"]}),
+        )
+
+    def test_namespace_and_values_matter(self):
+        params = {"created_on": date(2024, 1, 1)}
+        self.assertNotEqual(make_key("a", params), make_key("b", params))
+        self.assertNotEqual(
+            make_key("a", params), make_key("a", {"created_on": date(2024, 1, 2)})
+        )
+
+
+class TestCachedRequest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.settings = settings.model_copy()
+        self.settings.api_cache_enabled = True
+        self.settings.api_cache_file = os.path.join(self.tmp_dir.name, "api.sqlite")
+
+    def tearDown(self):
+        _caches.clear()
+        self.tmp_dir.cleanup()
+
+    async def test_second_call_is_served_from_cache(self):
+        request = AsyncMock(return_value={"total_results": 1})
+        params = {"created_on": date(2024, 1, 1)}
+
+        first = await cached_request(self.settings, "observations", params, 60, request)
+        second = await cached_request(
+            self.settings, "observations", params, 60, request
+        )
+
+        self.assertEqual(first, second)
+        request.assert_awaited_once()
+
+    async def test_disabled_cache_always_requests(self):
+        self.settings.api_cache_enabled = False
+        request = AsyncMock(return_value={"total_results": 1})
+
+        await cached_request(self.settings, "observations", {}, 60, request)
+        await cached_request(self.settings, "observations", {}, 60, request)
+
+        self.assertEqual(request.await_count, 2)
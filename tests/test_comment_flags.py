@@ -0,0 +1,59 @@
+import random
+import re
+import unittest
+
+from src.comment_flags import TermMatcher, get_comment_matcher
+from tests import settings
+
+
+class TestTermMatcher(unittest.TestCase):
+    def setUp(self):
+        self.matcher = TermMatcher(settings.comment_flags)
+
+    def test_whole_words_only(self):
+        self.assertEqual(
+            self.matcher.find_all("news about a new beetle, renewed"), [(13, "new")]
+        )
+
+    def test_longest_match_without_overlaps(self):
+        self.assertEqual(
+            [term for _, term in self.matcher.find_all("a brand new specie")],
+            ["brand new"],
+        )
+        self.assertEqual(
+            [term for _, term in self.matcher.find_all("new species first record")],
+            ["new", "first record"],
+        )
+
+    def test_case_insensitive(self):
+        self.assertEqual(
+            [term for _, term in self.matcher.find_all("Reported to CFIA")], ["cfia"]
+        )
+
+    def test_match_comments_keeps_comments_apart(self):
+        self.assertEqual(
+            self.matcher.match_comments(["first", "record", "", "new here, new"]),
+            [[], [], [], ["new", "new"]],
+        )
+        self.assertEqual(self.matcher.match_comments([]), [])
+
+    def test_same_matches_as_regex(self):
+        rng = random.Random(0)
+        words = ["new", "brand", "first", "record", "cfia", "x", "newt", "_new"]
+        terms = sorted(settings.comment_flags, key=len, reverse=True)
+        pattern = re.compile(r"\b(" + "|".join(map(re.escape, terms)) + r")\b")
+
+        for _ in range(200):
+            text = " ".join(rng.choice(words) for _ in range(rng.randint(0, 12)))
+            self.assertEqual(
+                [term for _, term in self.matcher.find_all(text)],
+                pattern.findall(text),
+                text,
+            )
+
+    def test_matcher_is_built_once_per_flag_list(self):
+        s = settings.model_copy()
+        self.assertIs(get_comment_matcher(s), get_comment_matcher(settings))
+
+        s.comment_flags = ["nouvelle espèce"]
+        self.assertEqual(get_comment_matcher(s).terms, ["nouvelle espèce"])
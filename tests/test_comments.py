@@ -0,0 +1,492 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from collections import Counter
+from datetime import UTC, date, datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pandas as pd
+
+from src.cache import _caches
+from src.comments import (
+    _flag_canadian_comments,
+    _flag_date,
+    get_all_canadian_observations_with_flagged_comments_df,
+    get_canadian_observations_with_flagged_comments_df,
+    get_late_canadian_flagged_comments_df,
+    save_late_comments_watermark,
+)
+from src.observations import COMMENT_COUNT_FIELDS
+from tests import settings
+
+
+def _observation(id, coordinates, *comments):
+    observation = MagicMock(
+        id=id,
+        comments_count=len(comments),
+        comments=[MagicMock(body=body) for body in comments],
+    )
+    observation.model_dump.return_value = {
+        "id": id,
+        "geojson": {"coordinates": coordinates},
+        "comments": [{"body": body} for body in comments],
+    }
+    return observation
+
+
+class TestFlagCanadianComments(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.settings = settings.model_copy()
+        self.settings.country_prefilter = True
+
+    async def test_empty_page(self):
+        df = await _flag_canadian_comments(self.settings, [], Counter())
+        self.assertTrue(df.empty)
+        self.assertEqual(df.columns.tolist(), self.settings.comments_columns)
+
+    @patch("src.geo.get_city_province_country_async")
+    async def test_one_row_per_flagged_comment(
+        self, mock_get_city_province_country_async
+    ):
+        mock_get_city_province_country_async.return_value = ("Toronto", "Ontario", "ca")
+        observations = [
+            _observation(
+                1,
+                [-79.38, 43.65],
+                "New to me, reported to CFIA",
+                "Nice",
+                "Brand new species?",
+            )
+        ]
+
+        df = await _flag_canadian_comments(self.settings, observations, Counter())
+
+        self.assertEqual(
+            df[self.settings.flagged_terms_column].tolist(), ["new, cfia", "brand new"]
+        )
+        self.assertEqual(df[self.settings.image_column].tolist(), [None, None])
+
+    @patch("src.geo.get_city_province_country_async")
+    async def test_only_flagged_canadian_candidates_are_geocoded(
+        self, mock_get_city_province_country_async
+    ):
+        mock_get_city_province_country_async.return_value = ("Toronto", "Ontario", "ca")
+        observations = [
+            _observation(1, [-79.38, 43.65]),
+            _observation(2, [-79.38, 43.65], "Nice photo"),
+            _observation(3, [-79.38, 43.65], "First record for Ontario!"),
+            _observation(4, [-87.63, 41.88], "Reported to the CFIA"),
+        ]
+        stage_counts = Counter()
+
+        df = await _flag_canadian_comments(self.settings, observations, stage_counts)
+
+        self.assertEqual(df.columns.tolist(), self.settings.comments_columns)
+        self.assertEqual(
+            df[self.settings.flagged_comments_column].tolist(),
+            ["first record for ontario"],
+        )
+        self.assertEqual(
+            df[self.settings.flagged_terms_column].tolist(), ["first record"]
+        )
+        self.assertEqual(df[self.settings.province_column].tolist(), ["Ontario"])
+        mock_get_city_province_country_async.assert_awaited_once_with(
+            self.settings, 43.65, -79.38
+        )
+        self.assertEqual(
+            stage_counts,
+            Counter(commented=3, flagged=2, prefiltered=1, canadian=1),
+        )
+
+
+class TestTwoPhaseFetch(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.settings = settings.model_copy()
+        self.settings.comments_two_phase_fetch = True
+        self.detailed = [_observation(2, [-79.38, 43.65], "First record!")]
+        self.scanned = [
+            _observation(1, [-79.38, 43.65]),
+            MagicMock(id=2, comments_count=1, comments=None),
+        ]
+
+    def _iter_observations(self, **kwargs):
+        self.scan_kwargs = kwargs
+
+        async def pages():
+            yield self.scanned
+
+        return pages()
+
+    @patch("src.geo.get_city_province_country_async", new_callable=AsyncMock)
+    @patch("src.comments.get_observations_by_ids", new_callable=AsyncMock)
+    @patch("src.comments.supports_field_projection", return_value=True)
+    @patch("src.comments.iter_observations")
+    async def test_details_fetched_for_commented_ids_only(
+        self,
+        mock_iter_observations,
+        _,
+        mock_get_observations_by_ids,
+        mock_get_city_province_country_async,
+    ):
+        mock_iter_observations.side_effect = self._iter_observations
+        mock_get_observations_by_ids.return_value = self.detailed
+        mock_get_city_province_country_async.return_value = ("Toronto", "Ontario", "ca")
+
+        df = await get_canadian_observations_with_flagged_comments_df(
+            self.settings, date(2024, 1, 1), ["insecta"]
+        )
+
+        self.assertEqual(self.scan_kwargs["fields"], COMMENT_COUNT_FIELDS)
+        mock_get_observations_by_ids.assert_awaited_once_with(self.settings, [2])
+        self.assertEqual(
+            df[self.settings.flagged_comments_column].tolist(), ["first record"]
+        )
+
+    @patch("src.comments.get_observations_by_ids", new_callable=AsyncMock)
+    @patch("src.comments.supports_field_projection", return_value=False)
+    @patch("src.comments.iter_observations")
+    async def test_single_phase_without_field_projection(
+        self, mock_iter_observations, _, mock_get_observations_by_ids
+    ):
+        mock_iter_observations.side_effect = self._iter_observations
+
+        _, comment_counts = await _flag_date(
+            self.settings, date(2024, 1, 1), ["insecta"]
+        )
+
+        self.assertIsNone(self.scan_kwargs["fields"])
+        mock_get_observations_by_ids.assert_not_awaited()
+        self.assertEqual(comment_counts, {2: 1})
+
+
+class TestAllDates(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.settings = settings.model_copy()
+        self.settings.comments_max_concurrent_dates = 2
+        self.settings.comments_date_max_retries = 1
+        self.settings.api_retry_backoff = 0.0
+        self.dates = [date(2024, 1, day) for day in range(1, 5)]
+
+    def _date_df(self, date_on):
+        return pd.DataFrame(
+            {column: [str(date_on)] for column in self.settings.comments_columns}
+        )
+
+    @patch("src.comments.get_canadian_observations_with_flagged_comments_df")
+    async def test_dates_run_concurrently_and_merge_in_order(self, mock_get_date_df):
+        in_flight, peak = 0, 0
+
+        async def get_date_df(s, date_on, iconic_taxa):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            # Later dates finish first
+            await asyncio.sleep(0.01 * (5 - date_on.day))
+            in_flight -= 1
+            return self._date_df(date_on)
+
+        mock_get_date_df.side_effect = get_date_df
+
+        df, failed_dates = await get_all_canadian_observations_with_flagged_comments_df(
+            self.settings, self.dates, ["insecta"]
+        )
+
+        self.assertEqual(
+            df[self.settings.name_column].tolist(), [str(d) for d in self.dates]
+        )
+        self.assertEqual(failed_dates, [])
+        self.assertEqual(peak, 2)
+
+    @patch("src.comments.get_canadian_observations_with_flagged_comments_df")
+    async def test_failing_dates_are_retried_then_skipped(self, mock_get_date_df):
+        attempts = Counter()
+
+        async def get_date_df(s, date_on, iconic_taxa):
+            attempts[date_on.day] += 1
+            if date_on.day == 2 and attempts[2] == 1:
+                raise RuntimeError("timeout")
+            if date_on.day == 3:
+                raise RuntimeError("down")
+            return self._date_df(date_on)
+
+        mock_get_date_df.side_effect = get_date_df
+
+        df, failed_dates = await get_all_canadian_observations_with_flagged_comments_df(
+            self.settings, self.dates, ["insecta"]
+        )
+
+        self.assertEqual(
+            df[self.settings.name_column].tolist(),
+            ["2024-01-01", "2024-01-02", "2024-01-04"],
+        )
+        self.assertEqual(failed_dates, [date(2024, 1, 3)])
+        self.assertEqual(attempts, Counter({1: 1, 2: 2, 3: 2, 4: 1}))
+
+    @patch("src.comments.get_canadian_observations_with_flagged_comments_df")
+    async def test_raises_when_every_date_fails(self, mock_get_date_df):
+        mock_get_date_df.side_effect = RuntimeError("down")
+
+        with self.assertRaises(RuntimeError):
+            await get_all_canadian_observations_with_flagged_comments_df(
+                self.settings, self.dates, ["insecta"]
+            )
+
+
+class TestCommentsDayCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.settings = settings.model_copy()
+        self.settings.comments_day_cache_enabled = True
+        self.settings.comments_day_cache_file = os.path.join(
+            self.tmp_dir.name, "days.sqlite"
+        )
+        self.settings.api_retry_backoff = 0.0
+        self.dates = [date(2024, 1, 1), date(2024, 1, 2)]
+        # No observation updated since the days were cached
+        self.updated = []
+        patcher = patch("src.comments.iter_observations", side_effect=self._updated)
+        self.mock_iter_observations = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _updated(self, **kwargs):
+        async def pages():
+            if self.updated:
+                yield self.updated
+
+        return pages()
+
+    def tearDown(self):
+        _caches.clear()
+        self.tmp_dir.cleanup()
+
+    async def _run(self, dates=None):
+        df, _ = await get_all_canadian_observations_with_flagged_comments_df(
+            self.settings, dates or self.dates, ["insecta"]
+        )
+        return df
+
+    @patch("src.comments._flag_date", new_callable=AsyncMock)
+    async def test_only_new_days_are_computed(self, mock_flag_date):
+        mock_flag_date.side_effect = lambda s, date_on, iconic_taxa, use_cache: (
+            pd.DataFrame({column: [str(date_on)] for column in s.comments_columns}),
+            {},
+        )
+
+        await self._run()
+        df = await self._run(self.dates[1:] + [date(2024, 1, 3)])
+
+        self.assertEqual(
+            [call.args[1] for call in mock_flag_date.call_args_list],
+            self.dates + [date(2024, 1, 3)],
+        )
+        self.assertEqual(
+            df[self.settings.name_column].tolist(), ["2024-01-02", "2024-01-03"]
+        )
+
+    @patch("src.comments._flag_date", new_callable=AsyncMock)
+    async def test_changed_flags_invalidate_days(self, mock_flag_date):
+        mock_flag_date.return_value = (
+            pd.DataFrame(columns=self.settings.comments_columns),
+            {},
+        )
+
+        await self._run()
+        self.settings.comment_flags = self.settings.comment_flags + ["nouvelle"]
+        await self._run()
+
+        self.assertEqual(mock_flag_date.call_count, 4)
+
+    @patch("src.comments.get_today")
+    @patch("src.comments._flag_date", new_callable=AsyncMock)
+    @patch(
+        "src.comments.get_canadian_observations_with_flagged_comments_df",
+        new_callable=AsyncMock,
+    )
+    async def test_today_is_not_cached(
+        self, mock_get_date_df, mock_flag_date, mock_get_today
+    ):
+        mock_get_today.return_value = self.dates[1]
+        empty_df = pd.DataFrame(columns=self.settings.comments_columns)
+        mock_get_date_df.return_value = empty_df
+        mock_flag_date.return_value = (empty_df, {})
+
+        await self._run()
+        await self._run()
+
+        self.assertEqual(
+            [call.args[1] for call in mock_flag_date.call_args_list], [self.dates[0]]
+        )
+        self.assertEqual(
+            [call.args[1] for call in mock_get_date_df.call_args_list],
+            [self.dates[1], self.dates[1]],
+        )
+
+    @patch("src.comments._flag_date", new_callable=AsyncMock)
+    async def test_day_with_late_comments_is_recomputed(self, mock_flag_date):
+        mock_flag_date.side_effect = [
+            (
+                pd.DataFrame(
+                    {column: [run] for column in self.settings.comments_columns}
+                ),
+                {1: 1},
+            )
+            for run in ["first run", "second run"]
+        ]
+
+        await self._run(self.dates[:1])
+        # A second comment was left on one of the date's observations
+        self.updated = [SimpleNamespace(id=1, comments_count=2)]
+        df = await self._run(self.dates[:1])
+
+        self.assertEqual(df[self.settings.name_column].tolist(), ["second run"])
+        self.assertFalse(mock_flag_date.call_args.kwargs["use_cache"])
+        check = self.mock_iter_observations.call_args.kwargs
+        self.assertEqual(check["date_on"], self.dates[0])
+        self.assertIsNotNone(check["updated_since"])
+        self.assertFalse(check["use_cache"])
+
+    @patch("src.comments._flag_date", new_callable=AsyncMock)
+    async def test_updates_without_new_comments_keep_the_day(self, mock_flag_date):
+        mock_flag_date.return_value = (
+            pd.DataFrame(
+                {column: ["run"] for column in self.settings.comments_columns}
+            ),
+            {1: 1},
+        )
+
+        await self._run(self.dates[:1])
+        # Identified or faved, but no new comment
+        self.updated = [
+            SimpleNamespace(id=1, comments_count=1),
+            SimpleNamespace(id=2, comments_count=0),
+        ]
+        await self._run(self.dates[:1])
+        first_check = self.mock_iter_observations.call_args.kwargs["updated_since"]
+        await self._run(self.dates[:1])
+
+        self.assertEqual(mock_flag_date.call_count, 1)
+        # Each check starts where the last one ended
+        self.assertGreater(
+            self.mock_iter_observations.call_args.kwargs["updated_since"], first_check
+        )
+
+
+class TestLateComments(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.settings = settings.model_copy()
+        self.settings.incremental_state_file = os.path.join(
+            self.tmp_dir.name, "state.sqlite"
+        )
+        self.scan_kwargs = []
+        self.pages = []
+
+    def tearDown(self):
+        _caches.clear()
+        self.tmp_dir.cleanup()
+
+    def _iter_observations(self, **kwargs):
+        self.scan_kwargs.append(kwargs)
+
+        async def pages():
+            for page in self.pages:
+                yield page
+
+        return pages()
+
+    def _commented(self, id, *comments):
+        observation = _observation(id, [-79.38, 43.65], *[c[0] for c in comments])
+        observation.comments = [
+            MagicMock(body=body, created_at=created_at) for body, created_at in comments
+        ]
+        return observation
+
+    async def _run(self, save=True):
+        df, watermark = await get_late_canadian_flagged_comments_df(
+            self.settings, date(2024, 1, 10), ["insecta"]
+        )
+        if save:
+            save_late_comments_watermark(self.settings, ["insecta"], watermark)
+        return df
+
+    @patch("src.comments.datetime")
+    @patch("src.geo.get_city_province_country_async", new_callable=AsyncMock)
+    @patch("src.comments.supports_field_projection", return_value=False)
+    @patch("src.comments.iter_observations")
+    async def test_only_comments_since_watermark_are_flagged(
+        self,
+        mock_iter_observations,
+        _,
+        mock_get_city_province_country_async,
+        mock_datetime,
+    ):
+        mock_iter_observations.side_effect = self._iter_observations
+        mock_get_city_province_country_async.return_value = ("Toronto", "Ontario", "ca")
+        mock_datetime.combine.side_effect = datetime.combine
+        first_run = datetime(2024, 1, 12, tzinfo=UTC)
+        second_run = datetime(2024, 1, 13, tzinfo=UTC)
+        old = ("First record!", datetime(2024, 1, 11, 8))
+        new = ("Reported to the CFIA", datetime(2024, 1, 12, 8))
+
+        mock_datetime.now.return_value = first_run
+        self.pages = [[self._commented(1, old)]]
+        first = await self._run()
+        mock_datetime.now.return_value = second_run
+        self.pages = [[self._commented(1, old, new)]]
+        second = await self._run()
+
+        self.assertEqual(
+            [kwargs["updated_since"] for kwargs in self.scan_kwargs],
+            [datetime(2024, 1, 10, tzinfo=UTC), first_run],
+        )
+        self.assertEqual(self.scan_kwargs[0]["date_to"].date(), date(2024, 1, 9))
+        self.assertEqual(
+            first[self.settings.flagged_comments_column].tolist(), ["first record"]
+        )
+        self.assertEqual(
+            second[self.settings.flagged_comments_column].tolist(),
+            ["reported to the cfia"],
+        )
+
+    @patch("src.comments.supports_field_projection", return_value=False)
+    @patch("src.comments.iter_observations")
+    async def test_watermark_kept_when_scan_fails(self, mock_iter_observations, _):
+        async def failing_pages():
+            raise RuntimeError("API down")
+            yield
+
+        mock_iter_observations.return_value = failing_pages()
+        with self.assertRaises(RuntimeError):
+            await self._run()
+
+        mock_iter_observations.side_effect = self._iter_observations
+        await self._run()
+
+        self.assertEqual(
+            self.scan_kwargs[0]["updated_since"],
+            datetime(2024, 1, 10, tzinfo=UTC),
+        )
+
+    @patch("src.comments.supports_field_projection", return_value=False)
+    @patch("src.comments.iter_observations")
+    async def test_watermark_only_moves_when_saved(self, mock_iter_observations, _):
+        mock_iter_observations.side_effect = self._iter_observations
+
+        await self._run(save=False)
+        await self._run(save=False)
+
+        self.assertEqual(
+            [kwargs["updated_since"] for kwargs in self.scan_kwargs],
+            [datetime(2024, 1, 10, tzinfo=UTC)] * 2,
+        )
+
+    @patch("src.comments.supports_comment_times", return_value=False)
+    @patch("src.comments.iter_observations")
+    async def test_refuses_to_scan_without_comment_times(
+        self, mock_iter_observations, _
+    ):
+        with self.assertRaises(ValueError):
+            await self._run()
+        mock_iter_observations.assert_not_called()
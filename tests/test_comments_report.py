@@ -1,11 +1,16 @@
 import unittest
-from datetime import date
-from unittest.mock import PropertyMock, patch
+from datetime import UTC, date, datetime
+from unittest.mock import AsyncMock, PropertyMock, patch
 
 import pandas as pd
 from jinja2 import Template
 
-from src.comments_report import build_comments_email_tables, send_flagged_comments_email
+from src.comments_report import (
+    build_comments_email_tables,
+    build_failed_dates_tables,
+    generate_and_send_comments_report,
+    send_flagged_comments_email,
+)
 from src.pydantic_models import EmailTable
 from tests import settings
 
@@ -31,6 +36,15 @@ class TestBuildCommentsEmailTables(unittest.TestCase):
         self.assertIn("<table", result[0].html)
         self.assertIn("http://example.com", result[0].html)
 
+    def test_failed_dates_table(self):
+        self.assertEqual(build_failed_dates_tables([]), [])
+
+        result = build_failed_dates_tables([date(2024, 1, 3)])
+
+        self.assertEqual(len(result), 1)
+        self.assertIn("Dates Not Processed", result[0].title)
+        self.assertIn("2024-01-03", result[0].html)
+
 
 class TestSendFlaggedCommentsEmail(unittest.TestCase):
     def setUp(self):
@@ -167,3 +181,74 @@ class TestSendFlaggedCommentsEmail(unittest.TestCase):
             ),
             expected_body,
         )
+
+
+@patch("src.comments_report.save_late_comments_watermark")
+@patch("src.comments_report.send_flagged_comments_email")
+@patch(
+    "src.comments_report.get_late_canadian_flagged_comments_df",
+    new_callable=AsyncMock,
+)
+@patch(
+    "src.comments_report.get_all_canadian_observations_with_flagged_comments_df",
+    new_callable=AsyncMock,
+)
+@patch(
+    "src.comments_report.get_recent_dates",
+    return_value=[date(2024, 1, 1), date(2024, 1, 7)],
+)
+class TestGenerateAndSendCommentsReport(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.settings = settings.model_copy()
+        self.settings.comments_late_scan = True
+        self.watermark = datetime(2024, 1, 8, tzinfo=UTC)
+        self.late_df = pd.DataFrame({"Flagged Comments": ["first record"]})
+
+    async def test_daily_failure_is_reported_with_late_rows(
+        self, _, mock_get_all, mock_get_late, mock_send_email, mock_save_watermark
+    ):
+        mock_get_all.side_effect = RuntimeError("API down")
+        mock_get_late.return_value = (self.late_df, self.watermark)
+
+        await generate_and_send_comments_report(self.settings)
+
+        df = mock_send_email.call_args.args[1]
+        self.assertEqual(df["Flagged Comments"].tolist(), ["first record"])
+        self.assertTrue(mock_send_email.call_args.kwargs["error"])
+
+    async def test_watermark_saved_after_email(
+        self, _, mock_get_all, mock_get_late, mock_send_email, mock_save_watermark
+    ):
+        mock_get_all.return_value = (pd.DataFrame(), [])
+        mock_get_late.return_value = (self.late_df, self.watermark)
+
+        await generate_and_send_comments_report(self.settings)
+
+        self.assertFalse(mock_send_email.call_args.kwargs["error"])
+        mock_save_watermark.assert_called_once_with(
+            self.settings, [self.settings.iconic_taxa], self.watermark
+        )
+
+    async def test_failed_dates_are_sent(
+        self, _, mock_get_all, mock_get_late, mock_send_email, mock_save_watermark
+    ):
+        mock_get_all.return_value = (pd.DataFrame(), [date(2024, 1, 3)])
+        mock_get_late.return_value = (self.late_df, self.watermark)
+
+        await generate_and_send_comments_report(self.settings)
+
+        self.assertEqual(
+            mock_send_email.call_args.kwargs["failed_dates"], [date(2024, 1, 3)]
+        )
+
+    async def test_watermark_kept_when_email_fails(
+        self, _, mock_get_all, mock_get_late, mock_send_email, mock_save_watermark
+    ):
+        mock_get_all.return_value = (pd.DataFrame(), [])
+        mock_get_late.return_value = (self.late_df, self.watermark)
+        mock_send_email.side_effect = OSError("SMTP down")
+
+        with self.assertRaises(OSError):
+            await generate_and_send_comments_report(self.settings)
+
+        mock_save_watermark.assert_not_called()
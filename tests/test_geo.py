@@ -1,13 +1,36 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
 import unittest
-from unittest.mock import MagicMock, patch
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import AsyncMock, MagicMock, patch
 
-from src.geo import get_city_province_country
+import numpy as np
+from geopy.exc import GeocoderServiceError, GeocoderTimedOut
+
+from src.cache import _caches
+from src.geo import (
+    _geolocators,
+    _nominatim_slots,
+    _nominatim_thread_slots,
+    get_async_geolocator,
+    get_city_province_country,
+    get_countries,
+    get_locations,
+    get_locations_async,
+    haversine_km,
+    points_in_ring,
+)
+from src.settings import GeocoderBackend
 from tests import settings
 
 
 class TestGeocoding(unittest.TestCase):
     def setUp(self):
         self.settings = settings.model_copy()
+        self.settings.nominatim_requests_per_second = 1000.0
 
     @patch("geopy.geocoders.Nominatim.reverse")
     def test_city_fallbacks(self, mock_reverse):
@@ -102,9 +125,251 @@ class TestGeocoding(unittest.TestCase):
         city, province, country = get_city_province_country(self.settings, 0.0, 0.0)
         self.assertEqual((city, province, country), ("", "", ""))
 
-    @patch("geopy.geocoders.Nominatim.reverse", side_effect=Exception("API Error"))
+    @patch(
+        "geopy.geocoders.Nominatim.reverse",
+        side_effect=GeocoderServiceError("API Error"),
+    )
     def test_exception_handling(self, mock_reverse):
         city, province, country = get_city_province_country(
             self.settings, 55.7558, 37.6173
         )
         self.assertEqual((city, province, country), ("", "", ""))
+
+
+class TestGetLocations(unittest.TestCase):
+    def setUp(self):
+        self.settings = settings.model_copy()
+        self.settings.geocoder = GeocoderBackend.OFFLINE
+
+    def test_offline_batch(self):
+        locations = get_locations(
+            self.settings, [(45.5017, -73.5673), (40.7128, -74.0060)]
+        )
+
+        self.assertEqual(locations[0][1:], ("Quebec", "ca"))
+        self.assertEqual(locations[1][1:], ("New York", "us"))
+
+    def test_offline_invalid_and_empty(self):
+        self.assertEqual(get_locations(self.settings, []), [])
+        self.assertEqual(
+            get_locations(self.settings, [(float("nan"), 0.0)]), [("", "", "")]
+        )
+
+    @patch("src.geo.get_city_province_country")
+    def test_nominatim_fallback_for_remote_points(self, mock_get_city_province_country):
+        self.settings.geocoder_nominatim_fallback = True
+        self.settings.geocoder_fallback_distance_km = 0.001
+        mock_get_city_province_country.return_value = ("Montreal", "Quebec", "ca")
+
+        locations = get_locations(self.settings, [(45.5017, -73.5673)])
+
+        self.assertEqual(locations, [("Montreal", "Quebec", "ca")])
+        mock_get_city_province_country.assert_called_once_with(
+            self.settings, 45.5017, -73.5673
+        )
+
+    def test_offline_country_follows_boundaries_across_borders(self):
+        # The nearest gazetteer place of Atlin, BC is Juneau, Alaska
+        locations = get_locations(self.settings, [(59.58, -133.69)])
+
+        self.assertEqual(locations, [("", "", "ca")])
+
+    @patch("src.geo.get_city_province_country")
+    def test_nominatim_fallback_for_cross_border_points(
+        self, mock_get_city_province_country
+    ):
+        self.settings.geocoder_nominatim_fallback = True
+        mock_get_city_province_country.return_value = (
+            "Atlin",
+            "British Columbia",
+            "ca",
+        )
+
+        locations = get_locations(self.settings, [(59.58, -133.69)])
+
+        self.assertEqual(locations, [("Atlin", "British Columbia", "ca")])
+        mock_get_city_province_country.assert_called_once()
+
+    @patch("src.geo.get_city_province_country")
+    def test_nominatim_backend(self, mock_get_city_province_country):
+        self.settings.geocoder = GeocoderBackend.NOMINATIM
+        mock_get_city_province_country.return_value = ("Ottawa", "Ontario", "ca")
+
+        locations = get_locations(self.settings, [(45.42, -75.69), (45.42, -75.69)])
+
+        self.assertEqual(locations, [("Ottawa", "Ontario", "ca")] * 2)
+        mock_get_city_province_country.assert_called_once()
+
+    def test_haversine_km(self):
+        distances = haversine_km(np.array([[0.0, 0.0]]), np.array([[0.0, 1.0]]))
+        self.assertAlmostEqual(distances[0], 111.19, places=1)
+
+
+class TestBlockingGeocodingLimits(unittest.TestCase):
+    def setUp(self):
+        self.settings = settings.model_copy()
+        self.settings.geocoder = GeocoderBackend.NOMINATIM
+        self.settings.nominatim_max_concurrency = 2
+
+    def tearDown(self):
+        _nominatim_thread_slots.clear()
+
+    @patch("src.geo.get_nominatim_rate_limiter")
+    @patch("src.geo._get_locator")
+    def test_threads_share_the_limits(self, mock_get_locator, mock_get_rate_limiter):
+        lock = threading.Lock()
+        in_flight, peak = 0, 0
+
+        def reverse(point, language):
+            nonlocal in_flight, peak
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            time.sleep(0.01)
+            with lock:
+                in_flight -= 1
+            return MagicMock(raw={"address": {"country_code": "ca"}})
+
+        mock_get_locator.return_value.reverse = reverse
+        batches = [[(45.0 + i / 10, -75.0 - j) for i in range(4)] for j in range(3)]
+
+        with ThreadPoolExecutor(len(batches)) as pool:
+            list(pool.map(lambda b: get_locations(self.settings, b), batches))
+
+        self.assertEqual(peak, 2)
+        limiter = mock_get_rate_limiter.return_value
+        self.assertEqual(limiter.acquire_blocking.call_count, 12)
+
+
+class TestAsyncGeocoding(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.settings = settings.model_copy()
+        self.settings.geocoder = GeocoderBackend.NOMINATIM
+        self.settings.nominatim_max_concurrency = 3
+        self.settings.nominatim_requests_per_second = 1000.0
+
+    def tearDown(self):
+        _geolocators.clear()
+        _nominatim_slots.clear()
+
+    @patch("src.geo.get_async_geolocator")
+    async def test_concurrent_lookups_respect_limit(self, mock_get_async_geolocator):
+        in_flight, peak = 0, 0
+
+        async def reverse(point, language):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return MagicMock(raw={"address": {"city": "Ottawa", "country_code": "ca"}})
+
+        mock_get_async_geolocator.return_value.reverse = reverse
+        coordinates = [(45.0 + i / 10, -75.0) for i in range(10)]
+
+        locations = await get_locations_async(self.settings, coordinates)
+
+        self.assertEqual(locations, [("Ottawa", "", "ca")] * 10)
+        self.assertEqual(peak, 3)
+
+    @patch("src.geo.get_async_geolocator")
+    async def test_concurrent_batches_share_the_limit(self, mock_get_async_geolocator):
+        in_flight, peak = 0, 0
+
+        async def reverse(point, language):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return MagicMock(raw={"address": {"country_code": "ca"}})
+
+        mock_get_async_geolocator.return_value.reverse = reverse
+        batches = [[(45.0 + i / 10, -75.0 - j) for i in range(4)] for j in range(3)]
+
+        await asyncio.gather(
+            *(get_locations_async(self.settings, batch) for batch in batches)
+        )
+
+        self.assertEqual(peak, 3)
+
+    @patch("src.geo.get_async_geolocator")
+    async def test_failed_lookup_is_empty(self, mock_get_async_geolocator):
+        mock_get_async_geolocator.return_value.reverse = AsyncMock(
+            side_effect=GeocoderTimedOut("timeout")
+        )
+
+        locations = await get_locations_async(self.settings, [(45.42, -75.69)])
+
+        self.assertEqual(locations, [("", "", "")])
+
+    # The aiohttp session is only opened on the first request
+    @patch("geopy.adapters.aiohttp_available", True)
+    async def test_geolocator_is_shared_and_configurable(self):
+        self.settings.nominatim_domain = "nominatim.internal:8080"
+        self.settings.nominatim_scheme = "http"
+
+        geolocator = get_async_geolocator(self.settings)
+
+        self.assertIs(get_async_geolocator(self.settings), geolocator)
+        self.assertEqual(
+            geolocator.reverse_api, "http://nominatim.internal:8080/reverse"
+        )
+
+
+class TestGeocodeCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.settings = settings.model_copy()
+        self.settings.geocoder = GeocoderBackend.NOMINATIM
+        self.settings.geocode_cache_enabled = True
+        self.settings.geocode_cache_file = os.path.join(
+            self.tmp_dir.name, "geocode.sqlite"
+        )
+
+    def tearDown(self):
+        _caches.clear()
+        self.tmp_dir.cleanup()
+
+    @patch("src.geo.get_city_province_country")
+    def test_rounded_coordinates_share_an_entry(self, mock_get_city_province_country):
+        mock_get_city_province_country.return_value = ("Ottawa", "Ontario", "ca")
+
+        first = get_locations(self.settings, [(45.4212, -75.6972)])
+        second = get_locations(self.settings, [(45.4208, -75.6968)])
+
+        self.assertEqual(first, second)
+        mock_get_city_province_country.assert_called_once()
+
+    @patch("src.geo.get_city_province_country")
+    def test_failed_lookups_are_not_cached(self, mock_get_city_province_country):
+        mock_get_city_province_country.return_value = ("", "", "")
+
+        get_locations(self.settings, [(45.42, -75.69)])
+        get_locations(self.settings, [(45.42, -75.69)])
+
+        self.assertEqual(mock_get_city_province_country.call_count, 2)
+
+
+class TestGetCountries(unittest.TestCase):
+    def setUp(self):
+        self.settings = settings.model_copy()
+
+    def test_points_in_ring(self):
+        square = np.array([[0.0, 0.0], [0.0, 1.0], [1.0, 1.0], [1.0, 0.0]])
+        points = np.array([[0.5, 0.5], [1.5, 0.5], [0.5, -0.1]])
+        self.assertEqual(points_in_ring(points, square).tolist(), [True, False, False])
+
+    def test_countries_from_bundled_boundaries(self):
+        coordinates = [
+            (43.65, -79.38),  # Toronto
+            (41.88, -87.63),  # Chicago
+            (58.30, -134.42),  # Juneau
+            (64.18, -51.70),  # Nuuk
+            (42.33, -83.05),  # Detroit, on the border
+            (float("nan"), 0.0),
+        ]
+
+        countries = get_countries(self.settings, coordinates)
+
+        self.assertEqual(countries.tolist(), ["ca", "us", "us", "", None, None])
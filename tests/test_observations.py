@@ -1,15 +1,31 @@
+import asyncio
+import inspect
+import os
+import tempfile
 import unittest
-from datetime import date, datetime
+from datetime import UTC, date, datetime
+from types import SimpleNamespace
 from unittest.mock import AsyncMock, patch
 
 import pandas as pd
 from inaturalist_client import Observation
 from pydantic import ValidationError
 
+from src.cache import _caches
 from src.observations import (
+    ID_FIELDS,
+    PaginationMode,
+    _client_accepts_fields,
+    _to_rison_fields,
     get_all_observations,
+    get_all_observations_incremental,
+    get_observation_fields,
     get_observation_summaries_df,
     get_observations,
+    get_observations_by_ids,
+    get_observations_cache_ttl,
+    iter_observations,
+    supports_field_projection,
     transform_summaries_to_df,
 )
 from src.preprocess import flag_comments
@@ -17,10 +33,20 @@ from src.pydantic_models import ObservationSummary
 from tests import settings
 
 
+def _pages(*pages):
+    """Build a fake iter_observations yielding the given pages"""
+
+    async def iter_pages(*args, **kwargs):
+        for page in pages:
+            yield page
+
+    return iter_pages
+
+
 class TestGetObservations(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self):
         self.settings = settings
-        self.settings.api_request_delay = 0.0
+        self.settings.api_requests_per_second = 1000.0
         self.taxon_ids = None
         self.taxon_names = ["Panthera leo"]
         self.date_from = "2024-01-01"
@@ -130,6 +156,9 @@ class TestGetObservations(unittest.IsolatedAsyncioTestCase):
             order_by=None,
             order=None,
             iconic_taxa=None,
+            id_above=None,
+            id_below=None,
+            updated_since=None,
         )
 
     @patch(
@@ -167,6 +196,9 @@ class TestGetObservations(unittest.IsolatedAsyncioTestCase):
             order_by=None,
             order=None,
             iconic_taxa=None,
+            id_above=None,
+            id_below=None,
+            updated_since=None,
         )
 
     @patch(
@@ -208,6 +240,9 @@ class TestGetObservations(unittest.IsolatedAsyncioTestCase):
             order_by=None,
             order=None,
             iconic_taxa=None,
+            id_above=None,
+            id_below=None,
+            updated_since=None,
         )
 
     @patch(
@@ -247,6 +282,9 @@ class TestGetObservations(unittest.IsolatedAsyncioTestCase):
             order_by=None,
             order=None,
             iconic_taxa=None,
+            id_above=None,
+            id_below=None,
+            updated_since=None,
         )
 
     @patch(
@@ -291,8 +329,137 @@ class TestGetObservations(unittest.IsolatedAsyncioTestCase):
             order_by=None,
             order=None,
             iconic_taxa=None,
+            id_above=None,
+            id_below=None,
+            updated_since=None,
+        )
+
+    @patch(
+        "inaturalist_client.ObservationsApi.observations_get", new_callable=AsyncMock
+    )
+    async def test_get_observations_can_bypass_cache(self, mock_observations_get):
+        mock_observations_get.side_effect = [
+            SimpleNamespace(total_results=1, results=[]),
+            SimpleNamespace(total_results=2, results=[]),
+            SimpleNamespace(total_results=3, results=[]),
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            s = self.settings.model_copy()
+            s.api_cache_enabled = True
+            s.api_cache_file = os.path.join(tmp_dir, "api.sqlite")
+            try:
+                cached = await get_observations(s=s, taxon_ids=[1])
+                fresh = await get_observations(s=s, taxon_ids=[1], use_cache=False)
+                again = await get_observations(s=s, taxon_ids=[1])
+            finally:
+                _caches.clear()
+
+        self.assertEqual(cached.total_results, 1)
+        self.assertEqual(fresh.total_results, 2)
+        self.assertEqual(again.total_results, 1)
+
+
+class TestGetObservationsByIds(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.settings = settings.model_copy()
+        self.settings.api_requests_per_second = 1000.0
+        self.settings.api_ids_per_request = 2
+
+    @patch(
+        "inaturalist_client.ObservationsApi.observations_id_get",
+        new_callable=AsyncMock,
+    )
+    async def test_fetches_ids_in_chunks(self, mock_observations_id_get):
+        mock_observations_id_get.side_effect = lambda ids: SimpleNamespace(
+            results=[Observation(id=i) for i in ids]
         )
 
+        observations = await get_observations_by_ids(self.settings, [1, 2, 3, 4, 5])
+
+        self.assertEqual([o.id for o in observations], [1, 2, 3, 4, 5])
+        self.assertEqual(
+            [call.args[0] for call in mock_observations_id_get.await_args_list],
+            [[1, 2], [3, 4], [5]],
+        )
+
+    async def test_no_ids(self):
+        self.assertEqual(await get_observations_by_ids(self.settings, []), [])
+
+
+class TestGetObservationsCacheTtl(unittest.TestCase):
+    def setUp(self):
+        self.settings = settings.model_copy()
+
+    @patch("src.observations.get_today", return_value=date(2024, 2, 16))
+    def test_past_day_uses_long_ttl(self, mock_get_today):
+        self.assertEqual(
+            get_observations_cache_ttl(self.settings, None, date(2024, 2, 15)),
+            self.settings.api_cache_ttl_past_days,
+        )
+        self.assertEqual(
+            get_observations_cache_ttl(self.settings, datetime(2024, 2, 1), None),
+            self.settings.api_cache_ttl_past_days,
+        )
+
+    @patch("src.observations.get_today", return_value=date(2024, 2, 16))
+    def test_today_or_open_range_uses_short_ttl(self, mock_get_today):
+        self.assertEqual(
+            get_observations_cache_ttl(self.settings, None, date(2024, 2, 16)),
+            self.settings.api_cache_ttl_today,
+        )
+        self.assertEqual(
+            get_observations_cache_ttl(self.settings, None, None),
+            self.settings.api_cache_ttl_today,
+        )
+
+
+class TestObservationFields(unittest.TestCase):
+    def test_source_paths_follow_aliases(self):
+        paths = ObservationSummary.source_paths()
+        self.assertIn(("taxon", "preferred_common_name"), paths)
+        self.assertIn(("photos", "url"), paths)
+        self.assertIn(("comments", "body"), paths)
+        self.assertIn(("id",), paths)
+
+    def test_to_rison_fields(self):
+        self.assertEqual(
+            _to_rison_fields([["id"], ["taxon", "name"], ["taxon", "id"], ["taxon"]]),
+            "(id:!t,taxon:(id:!t,name:!t))",
+        )
+
+    def test_observation_fields(self):
+        fields = get_observation_fields()
+        self.assertTrue(fields.startswith("(") and fields.endswith(")"))
+        for field in [
+            "id:!t",
+            "comments:(body:!t,created_at:!t)",
+            "photos:(url:!t)",
+            "taxon:(",
+        ]:
+            self.assertIn(field, fields)
+        self.assertNotIn("image_urls", fields)
+        self.assertNotIn("flagged_terms", fields)
+
+
+class TestSupportsFieldProjection(unittest.TestCase):
+    def setUp(self):
+        _client_accepts_fields.cache_clear()
+        self.addCleanup(_client_accepts_fields.cache_clear)
+        self.settings = settings.model_copy()
+        self.settings.api_field_projection = True
+
+    @patch("src.observations.inspect.signature", wraps=inspect.signature)
+    def test_client_signature_checked_once(self, mock_signature):
+        first = supports_field_projection(self.settings)
+        second = supports_field_projection(self.settings)
+
+        self.assertEqual(first, second)
+        mock_signature.assert_called_once()
+
+    def test_disabled_by_setting(self):
+        self.settings.api_field_projection = False
+        self.assertFalse(supports_field_projection(self.settings))
+
 
 class TestObservationSummary(unittest.TestCase):
     def setUp(self):
@@ -420,6 +587,14 @@ class TestObservationSummary(unittest.TestCase):
         ]
         self.assertEqual(obs.cleaned_comments, expected_cleaned_comments)
 
+    def test_cleaned_comments_are_cached_and_reset(self):
+        obs = ObservationSummary.model_validate(self.example_data)
+        self.assertIs(obs.cleaned_comments, obs.cleaned_comments)
+        self.assertNotIn("cleaned_comments", obs.model_dump())
+
+        obs.comments = ["New comment!"]
+        self.assertEqual(obs.cleaned_comments, ["new comment"])
+
     def test_flag_comments(self):
         """Test flagging comments with specific terms"""
 
@@ -449,21 +624,19 @@ class TestObservationSummary(unittest.TestCase):
 class TestGetAllObservations(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self):
         self.settings = settings.model_copy()
-        self.settings.api_request_delay = 0.0
+        self.settings.api_requests_per_second = 1000.0
         self.taxon_ids = [47115]
         self.per_page = 2
+        self.settings.api_max_per_page = self.per_page
         self.page = 1
 
     @patch("src.observations.get_observations", new_callable=AsyncMock)
     async def test_get_all_observations_multiple_pages(self, mock_get_observations):
-        # First page with per_page=1 to get total results, then pagination with actual per_page
+        # The first page also gives the total results
         mock_get_observations.side_effect = [
-            AsyncMock(
-                total_results=4, results=[Observation(id=1)]
-            ),  # Initial request with per_page=1
             AsyncMock(
                 total_results=4, results=[Observation(id=1), Observation(id=2)]
-            ),  # First page with actual per_page
+            ),  # First page
             AsyncMock(
                 total_results=4, results=[Observation(id=3), Observation(id=4)]
             ),  # Second page
@@ -478,24 +651,140 @@ class TestGetAllObservations(unittest.IsolatedAsyncioTestCase):
         self.assertEqual([obs.id for obs in observations], [1, 2, 3, 4])
 
         # Verify the API calls
-        self.assertEqual(mock_get_observations.call_count, 3)
+        self.assertEqual(mock_get_observations.call_count, 2)
 
-        # Verify the arguments passed to each call
+        # Verify the arguments passed to each call, no per_page=1 probe
         calls = mock_get_observations.call_args_list
-        # First call should be with per_page=1 to get total results
         self.assertEqual(calls[0][1]["page"], 1)
-        self.assertEqual(calls[0][1]["per_page"], 1)
-        # Subsequent calls should use the actual per_page value
-        self.assertEqual(calls[1][1]["page"], 1)
+        self.assertEqual(calls[0][1]["per_page"], self.per_page)
+        self.assertEqual(calls[1][1]["page"], 2)
         self.assertEqual(calls[1][1]["per_page"], self.per_page)
-        self.assertEqual(calls[2][1]["page"], 2)
-        self.assertEqual(calls[2][1]["per_page"], self.per_page)
 
         # Verify all other parameters are consistent across calls
         for call in calls:
             self.assertEqual(call[1]["taxon_ids"], self.taxon_ids)
             self.assertEqual(call[1]["s"], self.settings)
 
+    @patch("src.observations.get_observations", new_callable=AsyncMock)
+    async def test_iter_observations_yields_pages(self, mock_get_observations):
+        mock_get_observations.side_effect = [
+            AsyncMock(total_results=3, results=[Observation(id=1), Observation(id=2)]),
+            AsyncMock(total_results=3, results=[Observation(id=3)]),
+        ]
+
+        pages = [
+            [o.id for o in page]
+            async for page in iter_observations(
+                s=self.settings, taxon_ids=self.taxon_ids, per_page=self.per_page
+            )
+        ]
+
+        self.assertEqual(pages, [[1, 2], [3]])
+
+    @patch("src.observations.get_observations", new_callable=AsyncMock)
+    async def test_get_all_observations_concurrent_pages_keep_order(
+        self, mock_get_observations
+    ):
+        self.settings.api_max_concurrency = 2
+        in_flight = 0
+        max_in_flight = 0
+
+        async def fake_get_observations(**kwargs):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            # Later pages answer first to check ordering is preserved
+            await asyncio.sleep(0.01 * (5 - kwargs["page"]))
+            in_flight -= 1
+            first_id = (kwargs["page"] - 1) * 2 + 1
+            return AsyncMock(
+                total_results=8,
+                results=[Observation(id=first_id), Observation(id=first_id + 1)],
+            )
+
+        mock_get_observations.side_effect = fake_get_observations
+
+        observations = await get_all_observations(
+            s=self.settings, taxon_ids=self.taxon_ids, per_page=self.per_page
+        )
+
+        self.assertEqual([obs.id for obs in observations], list(range(1, 9)))
+        self.assertEqual(max_in_flight, 2)
+        self.assertEqual(mock_get_observations.call_count, 4)
+
+    @patch("src.observations.get_observations", new_callable=AsyncMock)
+    async def test_get_all_observations_id_pagination(self, mock_get_observations):
+        mock_get_observations.side_effect = [
+            AsyncMock(total_results=3, results=[Observation(id=5), Observation(id=4)]),
+            AsyncMock(total_results=1, results=[Observation(id=3)]),
+        ]
+
+        observations = await get_all_observations(
+            s=self.settings,
+            taxon_ids=self.taxon_ids,
+            per_page=self.per_page,
+            pagination=PaginationMode.ID,
+        )
+
+        self.assertEqual([obs.id for obs in observations], [5, 4, 3])
+        calls = mock_get_observations.call_args_list
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[0][1]["order_by"], "id")
+        self.assertEqual(calls[0][1]["order"], "desc")
+        self.assertIsNone(calls[0][1]["id_below"])
+        self.assertEqual(calls[1][1]["id_below"], 4)
+        self.assertIsNone(calls[1][1]["id_above"])
+        self.assertEqual(calls[1][1]["page"], 1)
+
+    @patch("src.observations.get_observations", new_callable=AsyncMock)
+    async def test_get_all_observations_switches_to_id_pagination(
+        self, mock_get_observations
+    ):
+        self.settings.api_max_results_offset = 2
+        mock_get_observations.side_effect = [
+            AsyncMock(total_results=3, results=[Observation(id=1), Observation(id=2)]),
+            AsyncMock(total_results=1, results=[Observation(id=3)]),
+        ]
+
+        observations = await get_all_observations(
+            s=self.settings,
+            taxon_ids=self.taxon_ids,
+            per_page=self.per_page,
+            order="asc",
+        )
+
+        # The probe page is kept and the id scan carries on from its last id
+        self.assertEqual([obs.id for obs in observations], [1, 2, 3])
+        calls = mock_get_observations.call_args_list
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[0][1]["order_by"], "id")
+        self.assertEqual(calls[1][1]["id_above"], 2)
+        self.assertEqual(calls[1][1]["order"], "asc")
+
+    @patch("src.observations.get_observations", new_callable=AsyncMock)
+    async def test_switch_to_id_pagination_skips_probe_rows(
+        self, mock_get_observations
+    ):
+        self.settings.api_max_results_offset = 2
+        mock_get_observations.side_effect = [
+            AsyncMock(total_results=3, results=[Observation(id=3), Observation(id=1)]),
+            AsyncMock(total_results=3, results=[Observation(id=3), Observation(id=2)]),
+            AsyncMock(total_results=1, results=[Observation(id=1)]),
+        ]
+
+        observations = await get_all_observations(
+            s=self.settings,
+            taxon_ids=self.taxon_ids,
+            per_page=self.per_page,
+            order_by="updated_at",
+        )
+
+        self.assertEqual([obs.id for obs in observations], [3, 1, 2])
+        calls = mock_get_observations.call_args_list
+        self.assertEqual(calls[0][1]["order_by"], "updated_at")
+        self.assertIsNone(calls[1][1]["id_below"])
+        self.assertEqual(calls[2][1]["id_below"], 2)
+
     @patch("src.observations.get_observations", new_callable=AsyncMock)
     async def test_get_all_observations_single_page(self, mock_get_observations):
         mock_get_observations.return_value = AsyncMock(
@@ -509,7 +798,7 @@ class TestGetAllObservations(unittest.IsolatedAsyncioTestCase):
 
         self.assertEqual(len(observations), 1)
         self.assertEqual(observations[0].id, 1)
-        self.assertEqual(mock_get_observations.call_count, 2)
+        self.assertEqual(mock_get_observations.call_count, 1)
 
     @patch("src.observations.get_observations", new_callable=AsyncMock)
     async def test_get_all_observations_empty_response(self, mock_get_observations):
@@ -525,7 +814,6 @@ class TestGetAllObservations(unittest.IsolatedAsyncioTestCase):
     @patch("src.observations.get_observations", new_callable=AsyncMock)
     async def test_get_all_observations_pagination_logic(self, mock_get_observations):
         mock_get_observations.side_effect = [
-            AsyncMock(total_results=3, results=[Observation(id=1)]),
             AsyncMock(total_results=3, results=[Observation(id=1), Observation(id=2)]),
             AsyncMock(total_results=3, results=[Observation(id=3)]),
         ]
@@ -536,7 +824,30 @@ class TestGetAllObservations(unittest.IsolatedAsyncioTestCase):
 
         self.assertEqual(len(observations), 3)
         self.assertEqual([obs.id for obs in observations], [1, 2, 3])
-        self.assertEqual(mock_get_observations.call_count, 3)
+        self.assertEqual(mock_get_observations.call_count, 2)
+
+    @patch("src.observations.get_observations", new_callable=AsyncMock)
+    async def test_get_all_observations_grows_page_size(self, mock_get_observations):
+        self.settings.api_max_per_page = 4
+        self.settings.api_max_concurrency = 1
+
+        async def fake_get_observations(**kwargs):
+            size, page = kwargs["per_page"], kwargs["page"]
+            ids = range((page - 1) * size + 1, min(page * size, 8) + 1)
+            return AsyncMock(total_results=8, results=[Observation(id=i) for i in ids])
+
+        mock_get_observations.side_effect = fake_get_observations
+
+        observations = await get_all_observations(
+            s=self.settings, taxon_ids=self.taxon_ids, per_page=self.per_page
+        )
+
+        self.assertEqual([obs.id for obs in observations], list(range(1, 9)))
+        calls = [
+            (c[1]["page"], c[1]["per_page"])
+            for c in mock_get_observations.call_args_list
+        ]
+        self.assertEqual(calls, [(1, 2), (1, 4), (2, 4)])
 
     @patch("src.observations.get_observations", new_callable=AsyncMock)
     async def test_get_all_observations_returned_structure(self, mock_get_observations):
@@ -552,7 +863,7 @@ class TestGetAllObservations(unittest.IsolatedAsyncioTestCase):
         self.assertIsInstance(observations[0], Observation)
         self.assertEqual(observations[0].id, 1)
         self.assertEqual(observations[0].quality_grade, "research")
-        self.assertEqual(mock_get_observations.call_count, 2)
+        self.assertEqual(mock_get_observations.call_count, 1)
 
     @patch("src.observations.get_observations", new_callable=AsyncMock)
     async def test_get_all_observations_with_date_filter(self, mock_get_observations):
@@ -560,7 +871,6 @@ class TestGetAllObservations(unittest.IsolatedAsyncioTestCase):
         date_to = datetime(2024, 12, 31)
 
         mock_get_observations.side_effect = [
-            AsyncMock(total_results=2, results=[Observation(id=1)]),
             AsyncMock(total_results=2, results=[Observation(id=1), Observation(id=2)]),
         ]
 
@@ -574,7 +884,7 @@ class TestGetAllObservations(unittest.IsolatedAsyncioTestCase):
 
         self.assertEqual(len(observations), 2)
         self.assertEqual([obs.id for obs in observations], [1, 2])
-        self.assertEqual(mock_get_observations.call_count, 2)
+        self.assertEqual(mock_get_observations.call_count, 1)
 
     @patch("src.observations.get_observations", new_callable=AsyncMock)
     async def test_get_all_observations_with_area_filter(self, mock_get_observations):
@@ -591,7 +901,7 @@ class TestGetAllObservations(unittest.IsolatedAsyncioTestCase):
 
         self.assertEqual(len(observations), 1)
         self.assertEqual(observations[0].id, 1)
-        self.assertEqual(mock_get_observations.call_count, 2)
+        self.assertEqual(mock_get_observations.call_count, 1)
 
     @patch("src.observations.get_observations", new_callable=AsyncMock)
     async def test_get_all_observations_with_taxon_names(self, mock_get_observations):
@@ -610,7 +920,147 @@ class TestGetAllObservations(unittest.IsolatedAsyncioTestCase):
 
         self.assertEqual(len(observations), 1)
         self.assertEqual(observations[0].id, 1)
-        self.assertEqual(mock_get_observations.call_count, 2)
+        self.assertEqual(mock_get_observations.call_count, 1)
+
+
+class TestGetAllObservationsIncremental(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.settings = settings.model_copy()
+        self.settings.incremental_state_file = os.path.join(
+            self.tmp_dir.name, "state.sqlite"
+        )
+        self.date_on = date(2024, 2, 15)
+
+    async def asyncTearDown(self):
+        _caches.clear()
+        self.tmp_dir.cleanup()
+
+    def _count_page(self, total_results):
+        return SimpleNamespace(
+            total_results=total_results, results=[SimpleNamespace(id=0)]
+        )
+
+    @patch("src.observations.get_observations", new_callable=AsyncMock)
+    @patch("src.observations.get_all_observations", new_callable=AsyncMock)
+    async def test_second_run_fetches_only_newer_ids(
+        self, mock_get_all_observations, mock_get_observations
+    ):
+        mock_get_observations.return_value = self._count_page(3)
+        mock_get_all_observations.side_effect = [
+            [SimpleNamespace(id=1), SimpleNamespace(id=2)],
+            [SimpleNamespace(id=3)],
+        ]
+
+        await get_all_observations_incremental(
+            s=self.settings, taxon_ids=[1], date_on=self.date_on
+        )
+        observations = await get_all_observations_incremental(
+            s=self.settings, taxon_ids=[1], date_on=self.date_on
+        )
+
+        self.assertEqual([o.id for o in observations], [1, 2, 3])
+        delta_call = mock_get_all_observations.call_args_list[1][1]
+        self.assertEqual(delta_call["id_above"], 2)
+        self.assertIsNone(delta_call["updated_since"])
+
+    @patch("src.observations.get_observations", new_callable=AsyncMock)
+    @patch("src.observations.get_all_observations", new_callable=AsyncMock)
+    async def test_updated_observations_replace_stored_rows(
+        self, mock_get_all_observations, mock_get_observations
+    ):
+        mock_get_observations.return_value = self._count_page(2)
+        first_update = datetime(2024, 2, 15, 10, tzinfo=UTC)
+        second_update = datetime(2024, 2, 15, 12, tzinfo=UTC)
+        mock_get_all_observations.side_effect = [
+            [
+                SimpleNamespace(id=1, updated_at=first_update, grade="casual"),
+                SimpleNamespace(id=2, updated_at=first_update, grade="casual"),
+            ],
+            [SimpleNamespace(id=1, updated_at=second_update, grade="research")],
+        ]
+
+        await get_all_observations_incremental(
+            s=self.settings, taxon_ids=[1], date_on=self.date_on
+        )
+        observations = await get_all_observations_incremental(
+            s=self.settings, taxon_ids=[1], date_on=self.date_on
+        )
+
+        self.assertEqual(
+            [(o.id, o.grade) for o in observations], [(1, "research"), (2, "casual")]
+        )
+        delta_call = mock_get_all_observations.call_args_list[1][1]
+        self.assertEqual(delta_call["updated_since"], first_update)
+        self.assertIsNone(delta_call["id_above"])
+
+    @patch("src.observations.get_all_observations", new_callable=AsyncMock)
+    async def test_state_is_kept_per_query(self, mock_get_all_observations):
+        mock_get_all_observations.return_value = [SimpleNamespace(id=1)]
+
+        await get_all_observations_incremental(
+            s=self.settings, taxon_ids=[1], date_on=self.date_on
+        )
+        await get_all_observations_incremental(
+            s=self.settings, taxon_ids=[2], date_on=self.date_on
+        )
+
+        second_call = mock_get_all_observations.call_args_list[1][1]
+        self.assertNotIn("id_above", second_call)
+
+    @patch("src.observations.supports_field_projection", return_value=True)
+    @patch("src.observations.get_observations", new_callable=AsyncMock)
+    @patch("src.observations.get_all_observations", new_callable=AsyncMock)
+    async def test_rows_no_longer_matching_are_dropped(
+        self, mock_get_all_observations, mock_get_observations, _
+    ):
+        update = datetime(2024, 2, 15, 10, tzinfo=UTC)
+        mock_get_observations.return_value = self._count_page(2)
+        mock_get_all_observations.side_effect = [
+            [SimpleNamespace(id=i, updated_at=update) for i in (1, 2, 3)],
+            [],
+            [SimpleNamespace(id=1), SimpleNamespace(id=3)],
+        ]
+
+        await get_all_observations_incremental(
+            s=self.settings, taxon_ids=[1], date_on=self.date_on
+        )
+        observations = await get_all_observations_incremental(
+            s=self.settings, taxon_ids=[1], date_on=self.date_on
+        )
+
+        self.assertEqual([o.id for o in observations], [1, 3])
+        self.assertFalse(mock_get_observations.call_args[1]["use_cache"])
+        id_scan = mock_get_all_observations.call_args_list[2][1]
+        self.assertEqual(id_scan["fields"], ID_FIELDS)
+        self.assertFalse(id_scan["use_cache"])
+        self.assertNotIn("updated_since", id_scan)
+
+    @patch("src.observations.supports_field_projection", return_value=False)
+    @patch("src.observations.get_observations", new_callable=AsyncMock)
+    @patch("src.observations.get_all_observations", new_callable=AsyncMock)
+    async def test_rows_are_fetched_again_without_projection(
+        self, mock_get_all_observations, mock_get_observations, _
+    ):
+        update = datetime(2024, 2, 15, 10, tzinfo=UTC)
+        mock_get_observations.return_value = self._count_page(3)
+        mock_get_all_observations.side_effect = [
+            [SimpleNamespace(id=i, updated_at=update) for i in (1, 2, 3)],
+            [SimpleNamespace(id=4, updated_at=update)],
+            [SimpleNamespace(id=i, updated_at=update) for i in (2, 3, 4)],
+        ]
+
+        await get_all_observations_incremental(
+            s=self.settings, taxon_ids=[1], date_on=self.date_on
+        )
+        observations = await get_all_observations_incremental(
+            s=self.settings, taxon_ids=[1], date_on=self.date_on
+        )
+
+        self.assertEqual([o.id for o in observations], [2, 3, 4])
+        refetch = mock_get_all_observations.call_args_list[2][1]
+        self.assertFalse(refetch["use_cache"])
+        self.assertNotIn("fields", refetch)
 
 
 class TestTransformSummariesToDataFrame(unittest.TestCase):
@@ -675,6 +1125,18 @@ class TestTransformSummariesToDataFrame(unittest.TestCase):
         df2 = transform_summaries_to_df(self.sample_summaries, self.column_mapping)
         pd.testing.assert_frame_equal(df1, df2)
 
+    def test_cleaned_comments_only_when_asked(self):
+        df = transform_summaries_to_df(self.sample_summaries, self.column_mapping)
+        self.assertNotIn("cleaned_comments", df.columns)
+
+        df = transform_summaries_to_df(
+            self.sample_summaries, self.column_mapping, include_cleaned_comments=True
+        )
+        self.assertEqual(
+            df["cleaned_comments"].tolist(),
+            [s.cleaned_comments for s in self.sample_summaries],
+        )
+
     def test_empty_summaries(self):
         df = transform_summaries_to_df([], self.column_mapping)
         self.assertIsInstance(df, pd.DataFrame)
@@ -729,30 +1191,32 @@ class TestTransformSummariesToDataFrame(unittest.TestCase):
 class TestGetObservationSummariesDf(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self):
         self.settings = settings.model_copy()
-        self.settings.api_request_delay = 0.0
+        self.settings.api_requests_per_second = 1000.0
         self.taxon_ids = [12345]
         self.date_on = date(2024, 2, 15)
 
-    @patch("src.observations.get_all_observations", new_callable=AsyncMock)
-    async def test_returns_dataframe(self, mock_get_all_observations):
-        mock_get_all_observations.return_value = [
-            Observation(
-                id=1,
-                quality_grade="research",
-                taxon={
-                    "preferred_common_name": "Lion",
-                    "name": "Panthera leo",
-                    "iconic_taxon_name": "Mammalia",
-                    "id": 40151,
-                },
-                photos=[{"url": "https://example.com/photo.jpg"}],
-                geojson={"coordinates": [-87.7, 41.9]},
-                created_at_details={"var_date": self.date_on},
-                observed_on=datetime(2024, 2, 15),
-                user={"login": "test_user"},
-                uri="https://example.com/1",
-            )
-        ]
+    @patch("src.observations.iter_observations")
+    async def test_returns_dataframe(self, mock_iter_observations):
+        mock_iter_observations.side_effect = _pages(
+            [
+                Observation(
+                    id=1,
+                    quality_grade="research",
+                    taxon={
+                        "preferred_common_name": "Lion",
+                        "name": "Panthera leo",
+                        "iconic_taxon_name": "Mammalia",
+                        "id": 40151,
+                    },
+                    photos=[{"url": "https://example.com/photo.jpg"}],
+                    geojson={"coordinates": [-87.7, 41.9]},
+                    created_at_details={"var_date": self.date_on},
+                    observed_on=datetime(2024, 2, 15),
+                    user={"login": "test_user"},
+                    uri="https://example.com/1",
+                )
+            ]
+        )
 
         df = await get_observation_summaries_df(
             s=self.settings,
@@ -766,9 +1230,9 @@ class TestGetObservationSummariesDf(unittest.IsolatedAsyncioTestCase):
         expected_cols = list(self.settings.df_column_map_default.values())
         self.assertTrue(all(col in df.columns for col in expected_cols))
 
-    @patch("src.observations.get_all_observations", new_callable=AsyncMock)
-    async def test_empty_returns_empty_dataframe(self, mock_get_all_observations):
-        mock_get_all_observations.return_value = []
+    @patch("src.observations.iter_observations")
+    async def test_empty_returns_empty_dataframe(self, mock_iter_observations):
+        mock_iter_observations.side_effect = _pages()
 
         df = await get_observation_summaries_df(
             s=self.settings,
@@ -781,3 +1245,19 @@ class TestGetObservationSummariesDf(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(len(df), 0)
         expected_cols = list(self.settings.df_column_map_default.values())
         self.assertTrue(all(col in df.columns for col in expected_cols))
+
+    @patch("src.observations.iter_observations")
+    async def test_taxon_ids_are_chunked_and_deduplicated(self, mock_iter_observations):
+        self.settings.api_taxon_ids_per_query = 2
+        mock_iter_observations.side_effect = [
+            _pages([Observation(id=1), Observation(id=2)])(),
+            _pages([Observation(id=2), Observation(id=3)])(),
+        ]
+
+        df = await get_observation_summaries_df(
+            s=self.settings, taxon_ids=[10, 20, 30], date_on=self.date_on
+        )
+
+        self.assertEqual(len(df), 3)
+        chunks = [c[1]["taxon_ids"] for c in mock_iter_observations.call_args_list]
+        self.assertEqual(chunks, [[10, 20], [30]])
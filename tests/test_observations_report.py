@@ -1,9 +1,17 @@
+import asyncio
 import unittest
+from datetime import date
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pandas as pd
 
-from src.observation_reports import build_observations_email_tables
+from src.models import PredictionLabel
+from src.observation_reports import (
+    build_observations_email_tables,
+    generate_and_send_observation_report,
+)
 from src.settings import Settings
+from tests import settings
 
 
 class TestBuildEmailTables(unittest.TestCase):
@@ -90,3 +98,128 @@ class TestBuildEmailTables(unittest.TestCase):
             "US iconic_taxa: Other",
         }
         self.assertEqual(set(titles), expected)
+
+
+@patch("src.observation_reports.send_observation_report_email")
+@patch("src.observation_reports.clean_and_format_df")
+@patch("src.observation_reports.predict_invasiveness")
+@patch("src.observation_reports.load_densenet_model")
+@patch("src.observation_reports.get_specie_ids", new_callable=AsyncMock)
+@patch("src.observation_reports.get_observation_summaries_df", new_callable=AsyncMock)
+@patch("src.observation_reports.get_yesterday", return_value=date(2024, 1, 1))
+class TestGenerateAndSendObservationReport(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.settings = settings.model_copy()
+        self.model = MagicMock(name="model")
+        self.summaries = {
+            "ca": self._summaries("Anoplophora glabripennis"),
+            "us": self._summaries("Anoplophora chinensis"),
+            "non_invasive": self._summaries("Monochamus scutellatus"),
+        }
+
+    def _summaries(self, name):
+        s = self.settings
+        return pd.DataFrame(
+            {s.name_alt_column: [name], s.image_column: [["https://img"]]}
+        )
+
+    def _setup_mocks(
+        self,
+        mock_get_summaries,
+        mock_get_specie_ids,
+        mock_load_model,
+        mock_predict,
+        mock_clean,
+    ):
+        def get_summaries(s, taxon_ids, date_on, area):
+            if area == s.areas.US:
+                return self.summaries["us"]
+            if taxon_ids == ["82043"]:
+                return self.summaries["non_invasive"]
+            return self.summaries["ca"]
+
+        mock_get_summaries.side_effect = get_summaries
+        mock_get_specie_ids.return_value = ["1", "2"]
+        mock_load_model.return_value = self.model
+        mock_predict.side_effect = lambda s, images, model, label: (
+            [PredictionLabel.INVASIVE.value] * len(images)
+        )
+        mock_clean.side_effect = lambda s, df, columns: df
+
+    async def test_stages_share_their_inputs(
+        self,
+        _,
+        mock_get_summaries,
+        mock_get_specie_ids,
+        mock_load_model,
+        mock_predict,
+        mock_clean,
+        mock_send_email,
+    ):
+        self._setup_mocks(
+            mock_get_summaries,
+            mock_get_specie_ids,
+            mock_load_model,
+            mock_predict,
+            mock_clean,
+        )
+
+        await generate_and_send_observation_report(self.settings)
+
+        mock_load_model.assert_called_once()
+        mock_get_specie_ids.assert_awaited_once()
+        ca_fetches = [
+            call.kwargs["taxon_ids"]
+            for call in mock_get_summaries.call_args_list
+            if call.kwargs["area"] == self.settings.areas.CA
+        ]
+        self.assertIn(["1", "2"], ca_fetches)
+        for call in mock_predict.call_args_list:
+            self.assertIs(call.args[2], self.model)
+
+        ca_df, us_df = mock_send_email.call_args.args[1:3]
+        self.assertEqual(
+            ca_df[self.settings.name_alt_column].tolist(),
+            ["Anoplophora glabripennis", "Monochamus scutellatus"],
+        )
+        self.assertIs(us_df, self.summaries["us"])
+        self.assertFalse(mock_send_email.call_args.kwargs["error"])
+
+    async def test_failing_stage_cancels_the_others(
+        self,
+        _,
+        mock_get_summaries,
+        mock_get_specie_ids,
+        mock_load_model,
+        mock_predict,
+        mock_clean,
+        mock_send_email,
+    ):
+        self._setup_mocks(
+            mock_get_summaries,
+            mock_get_specie_ids,
+            mock_load_model,
+            mock_predict,
+            mock_clean,
+        )
+        us_cancelled = asyncio.Event()
+
+        async def hanging_fetch(s, taxon_ids, date_on, area):
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                us_cancelled.set()
+                raise
+
+        mock_get_summaries.side_effect = hanging_fetch
+        mock_get_specie_ids.side_effect = RuntimeError("species list down")
+
+        with self.assertRaises(ExceptionGroup) as ctx:
+            await generate_and_send_observation_report(self.settings)
+
+        # The Canadian stage waits on the species list and re-raises its error
+        self.assertEqual(
+            {str(e) for e in ctx.exception.exceptions}, {"species list down"}
+        )
+        self.assertTrue(us_cancelled.is_set())
+        mock_send_email.assert_not_called()
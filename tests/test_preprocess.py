@@ -7,12 +7,16 @@ import pandas as pd
 from src.observation_reports import exclude_non_invasive
 from src.preprocess import (
     add_location_details,
+    add_location_details_batch_async,
     add_location_details_df,
     clean_and_format_df,
     filter_ca_us_locations,
     flag_comments,
+    flag_comments_df,
     group_by_taxa,
     keep_only_first_sample_image,
+    prefilter_ca_us_locations,
+    prefilter_summaries_by_country,
 )
 from src.pydantic_models import ObservationSummary
 from tests import settings
@@ -25,7 +29,7 @@ class TestFilterNorthAmericanLocations(unittest.TestCase):
         self.settings.city_column = "City"
         self.settings.province_column = "Province"
 
-    @patch("src.preprocess.get_city_province_country")
+    @patch("src.geo.get_city_province_country")
     def test_filter_north_american_locations(self, mock_get_city_province_country):
         mock_get_city_province_country.side_effect = [
             ("Ottawa", "ON", "ca"),
@@ -55,7 +59,7 @@ class TestFilterNorthAmericanLocations(unittest.TestCase):
 
         pd.testing.assert_frame_equal(filtered_df, expected_df)
 
-    @patch("src.preprocess.get_city_province_country")
+    @patch("src.geo.get_city_province_country")
     def test_filter_all_non_north_american_locations(
         self, mock_get_city_province_country
     ):
@@ -77,7 +81,7 @@ class TestFilterNorthAmericanLocations(unittest.TestCase):
 
         self.assertTrue(filtered_df.empty)
 
-    @patch("src.preprocess.get_city_province_country")
+    @patch("src.geo.get_city_province_country")
     def test_filter_empty_dataframe(self, mock_get_city_province_country):
         df = pd.DataFrame({"coordinates": [], "Country": []})
         filtered_df = filter_ca_us_locations(self.settings, df)
@@ -95,6 +99,43 @@ class TestFilterNorthAmericanLocations(unittest.TestCase):
         pd.testing.assert_frame_equal(filtered_df, df)
 
 
+class TestCountryPrefilter(unittest.TestCase):
+    def setUp(self):
+        self.settings = settings.model_copy()
+        self.settings.country_prefilter = True
+        self.settings.coords_column = "coordinates"
+        # (lon, lat) of Toronto, Chicago, Mexico City and Detroit
+        self.coordinates = [
+            [-79.38, 43.65],
+            [-87.63, 41.88],
+            [-99.13, 19.43],
+            [-83.05, 42.33],
+        ]
+
+    def test_prefilter_ca_us_locations(self):
+        df = pd.DataFrame({"coordinates": self.coordinates, "id": [1, 2, 3, 4]})
+
+        filtered_df = prefilter_ca_us_locations(self.settings, df)
+
+        self.assertEqual(filtered_df["id"].tolist(), [1, 2, 4])
+
+    def test_prefilter_summaries_by_country(self):
+        summaries = [
+            ObservationSummary(id=i, coordinates=c)
+            for i, c in enumerate(self.coordinates)
+        ]
+        summaries.append(ObservationSummary(id=4, coordinates=[]))
+
+        filtered = prefilter_summaries_by_country(self.settings, summaries, "ca")
+
+        self.assertEqual([summary.id for summary in filtered], [0, 3, 4])
+
+    def test_prefilter_disabled(self):
+        self.settings.country_prefilter = False
+        df = pd.DataFrame({"coordinates": self.coordinates})
+        self.assertEqual(len(prefilter_ca_us_locations(self.settings, df)), 4)
+
+
 class TestExtractFirstSampleImage(unittest.TestCase):
     def setUp(self):
         self.settings = settings.model_copy()
@@ -249,7 +290,7 @@ class TestAddLocationDetailsDF(unittest.TestCase):
         self.settings.city_column = "City"
         self.settings.province_column = "Province"
 
-    @patch("src.preprocess.get_city_province_country")
+    @patch("src.geo.get_city_province_country")
     def test_add_location_details_df(self, mock_get_city_province_country):
         mock_get_city_province_country.side_effect = [
             ("Ottawa", "ON", "ca"),
@@ -282,6 +323,30 @@ class TestAddLocationDetailsDF(unittest.TestCase):
 
         pd.testing.assert_frame_equal(result_df, expected_df)
 
+    @patch("src.geo.get_city_province_country")
+    def test_add_location_details_df_geocodes_each_point_once(
+        self, mock_get_city_province_country
+    ):
+        mock_get_city_province_country.side_effect = [
+            ("Ottawa", "ON", "CA"),
+            ("New York", "NY", "US"),
+        ]
+        df = pd.DataFrame(
+            {
+                "coordinates": [
+                    (-75.6993, 45.4215),
+                    (-74.0060, 40.7128),
+                    (-75.6993, 45.4215),
+                ]
+            }
+        )
+
+        result_df = add_location_details_df(self.settings, df)
+
+        self.assertEqual(mock_get_city_province_country.call_count, 2)
+        self.assertEqual(list(result_df["City"]), ["Ottawa", "New York", "Ottawa"])
+        self.assertEqual(list(result_df["Country"]), ["ca", "us", "ca"])
+
     def test_add_location_details_df_empty(self):
         df = pd.DataFrame({"coordinates": []})
         result_df = add_location_details_df(self.settings, df)
@@ -329,6 +394,52 @@ class TestFlagComments(unittest.TestCase):
         self.assertEqual(len(result.flagged_comments), 0)
         self.assertEqual(len(result.flagged_terms), 0)
 
+    def test_flag_comments_df(self):
+        s = self.settings
+        df = pd.DataFrame(
+            {
+                s.observation_id_column: [1, 1, 2, 3],
+                s.comment_column: [
+                    "This species is INVASIVE! 🐛",
+                    "Normal observation",
+                    "Pest, pest and harmful",
+                    None,
+                ],
+            }
+        )
+
+        result = flag_comments_df(s, df)
+
+        self.assertEqual(result[s.observation_id_column].tolist(), [1, 2])
+        self.assertEqual(
+            result[s.flagged_comments_column].tolist(),
+            ["this species is invasive", "pest pest and harmful"],
+        )
+        self.assertEqual(
+            result[s.flagged_terms_column].tolist(), [["invasive"], ["pest", "harmful"]]
+        )
+
+    def test_flag_comments_matches_flag_comments_df(self):
+        comments = ["This species is INVASIVE! 🐛", "Pest, pest and harmful"]
+        summary = ObservationSummary(id=1, comments=comments)
+
+        result = flag_comments(self.settings, summary)
+
+        self.assertEqual(
+            result.flagged_comments,
+            ["this species is invasive", "pest pest and harmful"],
+        )
+        self.assertEqual(result.flagged_terms, ["invasive", "pest", "harmful"])
+
+    def test_flag_comments_df_empty(self):
+        s = self.settings
+        df = pd.DataFrame(columns=[s.observation_id_column, s.comment_column])
+
+        result = flag_comments_df(s, df)
+
+        self.assertTrue(result.empty)
+        self.assertIn(s.flagged_terms_column, result.columns)
+
 
 class TestCleanAndFormatDF(unittest.TestCase):
     def setUp(self):
@@ -346,7 +457,7 @@ class TestCleanAndFormatDF(unittest.TestCase):
             self.s.image_column,
         ]
 
-    @patch("src.preprocess.get_city_province_country")
+    @patch("src.geo.get_city_province_country")
     def test_clean_and_format_df_happy_path(self, mock_get_location):
         mock_get_location.side_effect = [
             ("Ottawa", "ON", "ca"),
@@ -374,7 +485,7 @@ class TestCleanAndFormatDF(unittest.TestCase):
 
         pd.testing.assert_frame_equal(result, expected)
 
-    @patch("src.preprocess.get_city_province_country")
+    @patch("src.geo.get_city_province_country")
     def test_clean_and_format_df_with_duplicates(self, mock_get_location):
         mock_get_location.side_effect = [
             ("Ottawa", "ON", "ca"),
@@ -401,13 +512,13 @@ class TestCleanAndFormatDF(unittest.TestCase):
 
         pd.testing.assert_frame_equal(result, expected)
 
-    @patch("src.preprocess.get_city_province_country")
+    @patch("src.geo.get_city_province_country")
     def test_clean_and_format_df_empty_input(self, mock_get_location):
         df = pd.DataFrame(columns=["Observation ID", "Coordinates", "Image URLs"])
         result = clean_and_format_df(self.s, df, self.columns)
         self.assertTrue(result.empty)
 
-    @patch("src.preprocess.get_city_province_country")
+    @patch("src.geo.get_city_province_country")
     def test_clean_and_format_df_non_north_american(self, mock_get_location):
         mock_get_location.side_effect = [
             ("Paris", "Île-de-France", "fr"),
@@ -426,18 +537,18 @@ class TestCleanAndFormatDF(unittest.TestCase):
         self.assertTrue(result.empty)
 
 
-class TestAddLocationDetails(unittest.TestCase):
+class TestAddLocationDetails(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
         """Set up common test variables"""
         self.settings = settings
-        self.settings.api_request_delay = 0.0
+        self.settings.api_requests_per_second = 1000.0
         self.summary_with_coords = ObservationSummary(
             id=1,
             coordinates=[-79.3832, 43.6532],
         )
         self.summary_without_coords = ObservationSummary(id=2, coordinates=[])
 
-    @patch("src.preprocess.get_city_province_country")
+    @patch("src.geo.get_city_province_country")
     def test_add_location_details_with_coordinates(
         self, mock_get_city_province_country
     ):
@@ -453,6 +564,24 @@ class TestAddLocationDetails(unittest.TestCase):
             self.settings, 43.6532, -79.3832
         )
 
+    @patch("src.geo.get_city_province_country_async")
+    async def test_add_location_details_batch_async(
+        self, mock_get_city_province_country_async
+    ):
+        mock_get_city_province_country_async.return_value = ("Toronto", "Ontario", "ca")
+        summaries = [
+            self.summary_with_coords,
+            self.summary_without_coords,
+            ObservationSummary(id=3, coordinates=[-79.3832, 43.6532]),
+        ]
+
+        result = await add_location_details_batch_async(self.settings, summaries)
+
+        self.assertEqual([r.city for r in result], ["Toronto", None, "Toronto"])
+        mock_get_city_province_country_async.assert_awaited_once_with(
+            self.settings, 43.6532, -79.3832
+        )
+
     def test_add_location_details_without_coordinates(self):
         """Test that location details remain None when no coordinates exist"""
         result = add_location_details(self.settings, self.summary_without_coords)
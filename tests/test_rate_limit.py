@@ -0,0 +1,119 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from inaturalist_client.exceptions import ApiException
+
+from src.rate_limit import (
+    TokenBucket,
+    _buckets,
+    get_rate_limiter,
+    parse_retry_after,
+    rate_limited,
+)
+from tests import settings
+
+
+class TestTokenBucket(unittest.IsolatedAsyncioTestCase):
+    @patch("src.rate_limit.asyncio.sleep", new_callable=AsyncMock)
+    async def test_burst_then_waits(self, mock_sleep):
+        bucket = TokenBucket(rate=2.0, capacity=2)
+
+        await bucket.acquire()
+        await bucket.acquire()
+        mock_sleep.assert_not_awaited()
+
+        await bucket.acquire()
+        mock_sleep.assert_awaited_once()
+        self.assertAlmostEqual(mock_sleep.await_args[0][0], 0.5, places=1)
+
+    @patch("src.rate_limit.asyncio.sleep", new_callable=AsyncMock)
+    async def test_throttled_pauses_and_slows_down(self, mock_sleep):
+        bucket = TokenBucket(rate=4.0, capacity=4)
+
+        bucket.throttled(3.0)
+        await bucket.acquire()
+
+        self.assertAlmostEqual(mock_sleep.await_args[0][0], 3.0, places=1)
+        self.assertEqual(bucket.rate, 2.0)
+
+        bucket.succeeded()
+        self.assertAlmostEqual(bucket.rate, 2.4)
+
+
+class TestParseRetryAfter(unittest.TestCase):
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after("7"), 7.0)
+
+    def test_missing_or_invalid(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+
+    def test_past_http_date(self):
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+
+
+class TestRateLimited(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.settings = settings.model_copy()
+        self.settings.api_max_retries = 2
+
+    def tearDown(self):
+        _buckets.clear()
+
+    def _error(self, status, headers=None):
+        error = ApiException(status=status, reason="error")
+        error.headers = headers
+        return error
+
+    @patch("src.rate_limit.asyncio.sleep", new_callable=AsyncMock)
+    async def test_retries_after_429_honouring_retry_after(self, mock_sleep):
+        request = AsyncMock(
+            side_effect=[self._error(429, {"Retry-After": "7"}), "result"]
+        )
+
+        result = await rate_limited(self.settings, request)
+
+        self.assertEqual(result, "result")
+        self.assertEqual(request.await_count, 2)
+        self.assertAlmostEqual(mock_sleep.await_args[0][0], 7.0, places=1)
+
+    @patch("src.rate_limit.asyncio.sleep", new_callable=AsyncMock)
+    async def test_gives_up_after_max_retries(self, mock_sleep):
+        request = AsyncMock(side_effect=self._error(503))
+
+        with self.assertRaises(ApiException):
+            await rate_limited(self.settings, request)
+
+        self.assertEqual(request.await_count, 3)
+
+    async def test_other_errors_are_not_retried(self):
+        request = AsyncMock(side_effect=self._error(404))
+
+        with self.assertRaises(ApiException):
+            await rate_limited(self.settings, request)
+
+        self.assertEqual(request.await_count, 1)
+
+    async def test_in_flight_requests_are_capped(self):
+        self.settings.api_max_concurrency = 2
+        self.settings.api_requests_per_second = 1000.0
+        self.settings.api_burst = 10
+        in_flight, peak = 0, 0
+
+        async def request():
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+
+        await asyncio.gather(*(rate_limited(self.settings, request) for _ in range(6)))
+
+        self.assertEqual(peak, 2)
+
+    def test_bucket_shared_per_host(self):
+        self.assertIs(
+            get_rate_limiter(self.settings),
+            get_rate_limiter(self.settings.model_copy()),
+        )
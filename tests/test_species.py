@@ -10,7 +10,7 @@ class TestGetSpecieIds(unittest.IsolatedAsyncioTestCase):
         self.settings = settings.model_copy()
         self.settings.project_id = "1"
 
-    @patch("src.species.ApiClient")
+    @patch("src.species.get_api_client")
     @patch("src.species.ProjectsApi")
     async def test_returns_taxon_ids(self, mock_api_class, mock_api_client):
         mock_api = AsyncMock()
@@ -28,7 +28,7 @@ class TestGetSpecieIds(unittest.IsolatedAsyncioTestCase):
         ids = await get_specie_ids(self.settings)
         self.assertEqual(ids, [1, 2])
 
-    @patch("src.species.ApiClient")
+    @patch("src.species.get_api_client")
     @patch("src.species.ProjectsApi")
     async def test_returns_empty_list_on_empty_results(
         self, mock_api_class, mock_api_client
@@ -40,7 +40,7 @@ class TestGetSpecieIds(unittest.IsolatedAsyncioTestCase):
         ids = await get_specie_ids(self.settings)
         self.assertEqual(ids, [])
 
-    @patch("src.species.ApiClient")
+    @patch("src.species.get_api_client")
     @patch("src.species.ProjectsApi")
     async def test_skips_none_taxon(self, mock_api_class, mock_api_client):
         mock_api = AsyncMock()
@@ -57,7 +57,7 @@ class TestGetSpecieIds(unittest.IsolatedAsyncioTestCase):
         ids = await get_specie_ids(self.settings)
         self.assertEqual(ids, [4])
 
-    @patch("src.species.ApiClient")
+    @patch("src.species.get_api_client")
     @patch("src.species.ProjectsApi")
     async def test_skips_taxon_with_none_id(self, mock_api_class, mock_api_client):
         mock_api = AsyncMock()